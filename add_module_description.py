@@ -4,32 +4,94 @@ Simple tool to add detailed descriptions to modules one at a time
 This allows you to carefully review and validate each description before adding it
 """
 
+import atexit
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from dotenv import load_dotenv
 import os
-import json
+import sys
+import time
 from typing import List, Optional
+from enhance_descriptions import dumps_json
 
 load_dotenv()
 
+class _PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has PREPAREd"""
+    prepared_list = False
+
+# Shared connection pool (created on first use)
+_POOL = None
+
+def _get_pool():
+    """Get the connection pool, creating it if necessary"""
+    global _POOL
+    if _POOL is None:
+        _POOL = psycopg2.pool.ThreadedConnectionPool(
+            1, 8, dsn=os.getenv('DATABASE_URL'), connection_factory=_PooledConnection
+        )
+        atexit.register(_POOL.closeall)
+    return _POOL
+
 def get_db_connection():
-    """Get database connection"""
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
+    """Get database connection from the pool"""
+    return _get_pool().getconn()
+
+def release_db_connection(conn):
+    """Return a database connection to the pool"""
+    _get_pool().putconn(conn)
+
+# Module list rarely changes during a session, so cache the query result
+_MODULES_SQL = """
+    SELECT title, project_name,
+           (description IS NOT NULL AND length(description) > 50) AS has_desc
+    FROM chatbot.objects 
+    WHERE object_type = 'workbook'
+    ORDER BY project_name, title
+"""
+_CACHE_TTL = 60
+_MODULES_CACHE = {"ts": 0, "data": None}
+
+def _fetch_modules():
+    """Fetch workbook rows, reusing the cached result while it is fresh"""
+    if time.time() - _MODULES_CACHE["ts"] < _CACHE_TTL:
+        return _MODULES_CACHE["data"]
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Prepare once per pooled connection; the plan persists for the session
+        if not conn.prepared_list:
+            cursor.execute("PREPARE list_modules_stmt AS " + _MODULES_SQL)
+            conn.prepared_list = True
+        cursor.execute("EXECUTE list_modules_stmt")
+        # Many workbooks share a project; intern so the cache holds one copy of each name
+        results = [
+            (title, sys.intern(project_name) if project_name else project_name, has_desc)
+            for title, project_name, has_desc in cursor
+        ]
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+    
+    _MODULES_CACHE.update(ts=time.time(), data=results)
+    return results
+
+def _mark_module_described(title: str, has_desc: bool):
+    """Patch the cached row for an updated module instead of dropping the cache"""
+    data = _MODULES_CACHE["data"]
+    if data is None:
+        return
+    _MODULES_CACHE["data"] = [
+        (row_title, project_name, has_desc if row_title == title else row_has_desc)
+        for row_title, project_name, row_has_desc in data
+    ]
 
 def list_modules():
     """List all available modules for selection"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT title, project_name, description
-            FROM chatbot.objects 
-            WHERE object_type = 'workbook'
-            ORDER BY project_name, title
-        """)
-        
-        results = cursor.fetchall()
+        results = _fetch_modules()
         
         print("📋 Available Modules:")
         print("=" * 80)
@@ -37,17 +99,16 @@ def list_modules():
         current_project = None
         module_list = []
         
-        for i, (title, project_name, description) in enumerate(results, 1):
+        for i, (title, project_name, has_desc) in enumerate(results, 1):
             if project_name != current_project:
                 print(f"\n📁 {project_name}")
                 current_project = project_name
             
-            has_description = "✅" if description and len(description) > 50 else "❌"
+            has_description = "✅" if has_desc else "❌"
             print(f"  {i:2d}. {has_description} {title}")
-            module_list.append((i, title, project_name, description))
+            # Description text is no longer fetched; callers only use the title
+            module_list.append((i, title, project_name, None))
         
-        cursor.close()
-        conn.close()
         return module_list
         
     except Exception as e:
@@ -68,50 +129,55 @@ def add_description(module_title: str, detailed_description: str,
         usage_notes: How to use the module effectively (optional)
         target_audience: Who should use this module (optional)
     """
+    # Create rich description object
+    rich_description = {
+        "detailed_description": detailed_description,
+        "purpose": purpose or "",
+        "key_metrics": key_metrics or [],
+        "usage_notes": usage_notes or "",
+        "target_audience": target_audience or "",
+        "last_updated": "2025-01-12"
+    }
+    
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Create rich description object
-        rich_description = {
-            "detailed_description": detailed_description,
-            "purpose": purpose or "",
-            "key_metrics": key_metrics or [],
-            "usage_notes": usage_notes or "",
-            "target_audience": target_audience or "",
-            "last_updated": "2025-01-12"
-        }
-        
-        # Update the description field with JSON
-        cursor.execute("""
-            UPDATE chatbot.objects 
-            SET description = %s
-            WHERE title = %s AND object_type = 'workbook'
-        """, [json.dumps(rich_description), module_title])
-        
-        if cursor.rowcount > 0:
-            print(f"✅ Successfully updated: {module_title}")
-            conn.commit()
-            return True
-        else:
-            print(f"❌ Module not found: {module_title}")
-            return False
+    except Exception as e:
+        print(f"❌ Error updating {module_title}: {e}")
+        return False
+    
+    try:
+        with conn.cursor() as cursor:
+            # Update the description field with JSON
+            payload = dumps_json(rich_description)
+            cursor.execute("""
+                UPDATE chatbot.objects 
+                SET description = %s
+                WHERE title = %s AND object_type = 'workbook'
+                RETURNING object_id
+            """, [payload, module_title])
+            updated_ids = cursor.fetchall()
             
-        cursor.close()
-        conn.close()
+            if updated_ids:
+                print(f"✅ Successfully updated: {module_title}")
+                conn.commit()
+                _mark_module_described(module_title, len(payload) > 50)
+                return True
+            else:
+                print(f"❌ Module not found: {module_title}")
+                return False
         
     except Exception as e:
         print(f"❌ Error updating {module_title}: {e}")
         return False
+    finally:
+        # Always hand the connection back, whichever branch returned
+        release_db_connection(conn)
 
 def preview_description(module_title: str, detailed_description: str, 
                        purpose: str = None, key_metrics: List[str] = None,
                        usage_notes: str = None, target_audience: str = None):
     """Preview how the description will look in the chatbot"""
     
-    print(f"\n📝 Preview for: {module_title}")
-    print("=" * 60)
-    
     response_parts = [f"**{module_title}**"]
     
     if detailed_description:
@@ -122,8 +188,7 @@ def preview_description(module_title: str, detailed_description: str,
     
     if key_metrics:
         response_parts.append(f"\n**Key Metrics:**")
-        for metric in key_metrics:
-            response_parts.append(f"• {metric}")
+        response_parts.extend(f"• {metric}" for metric in key_metrics)
     
     if usage_notes:
         response_parts.append(f"\n**Usage Notes:** {usage_notes}")
@@ -131,12 +196,44 @@ def preview_description(module_title: str, detailed_description: str,
     if target_audience:
         response_parts.append(f"\n**Target Audience:** {target_audience}")
     
-    print("\n".join(response_parts))
-    print("=" * 60)
+    # Emit the whole preview in one write
+    sys.stdout.write("\n".join([f"\n📝 Preview for: {module_title}", "=" * 60,
+                                 *response_parts, "=" * 60]) + "\n")
+
+def _read_key_metrics(_input) -> List[str]:
+    """Collect key metrics either as a pasted block or one per prompt"""
+    if sys.stdin.isatty():
+        paste = _input("\nPaste key metrics as a block? (y/n): ").strip().lower()
+        if paste == 'y':
+            # One read for the whole block instead of a prompt per metric
+            print("Paste metrics (one per line), then press Ctrl-D (Ctrl-Z, Enter on Windows) to finish:")
+            raw = sys.stdin.read()
+            return [line.strip() for line in raw.splitlines() if line.strip()]
+    
+    print("\nEnter key metrics (one per line, press Enter twice when done):")
+    key_metrics = []
+    while True:
+        metric = _input("  Metric: ").strip()
+        if not metric:
+            break
+        key_metrics.append(metric)
+    return key_metrics
 
 def interactive_add():
     """Interactive tool to add descriptions one at a time"""
     
+    if sys.stdin.isatty():
+        _input = input
+    else:
+        # Piped/heredoc usage: read the whole payload once instead of line by line
+        lines = iter(sys.stdin.read().splitlines())
+        
+        def _input(prompt=''):
+            try:
+                return next(lines)
+            except StopIteration:
+                raise EOFError from None
+    
     while True:
         print("\n🔧 Module Description Tool")
         print("=" * 30)
@@ -145,7 +242,11 @@ def interactive_add():
         print("3. Preview description")
         print("4. Exit")
         
-        choice = input("\nEnter your choice (1-4): ").strip()
+        try:
+            choice = _input("\nEnter your choice (1-4): ").strip()
+        except EOFError:
+            print("Goodbye!")
+            break
         
         if choice == "1":
             list_modules()
@@ -157,7 +258,7 @@ def interactive_add():
                 continue
             
             try:
-                module_num = int(input(f"\nEnter module number (1-{len(modules)}): "))
+                module_num = int(_input(f"\nEnter module number (1-{len(modules)}): "))
                 if 1 <= module_num <= len(modules):
                     selected_module = modules[module_num - 1]
                     module_title = selected_module[1]
@@ -166,30 +267,24 @@ def interactive_add():
                     print("-" * 50)
                     
                     # Get description details
-                    detailed_description = input("Enter detailed description: ").strip()
+                    detailed_description = _input("Enter detailed description: ").strip()
                     if not detailed_description:
                         print("❌ Description is required!")
                         continue
                     
-                    purpose = input("Enter purpose (optional): ").strip() or None
-                    usage_notes = input("Enter usage notes (optional): ").strip() or None
-                    target_audience = input("Enter target audience (optional): ").strip() or None
+                    purpose = _input("Enter purpose (optional): ").strip() or None
+                    usage_notes = _input("Enter usage notes (optional): ").strip() or None
+                    target_audience = _input("Enter target audience (optional): ").strip() or None
                     
                     # Get key metrics
-                    print("\nEnter key metrics (one per line, press Enter twice when done):")
-                    key_metrics = []
-                    while True:
-                        metric = input("  Metric: ").strip()
-                        if not metric:
-                            break
-                        key_metrics.append(metric)
+                    key_metrics = _read_key_metrics(_input)
                     
                     # Preview before saving
                     print(f"\n🔍 Preview:")
                     preview_description(module_title, detailed_description, purpose, key_metrics, usage_notes, target_audience)
                     
                     # Confirm save
-                    confirm = input("\nSave this description? (y/n): ").strip().lower()
+                    confirm = _input("\nSave this description? (y/n): ").strip().lower()
                     if confirm == 'y':
                         add_description(module_title, detailed_description, purpose, key_metrics, usage_notes, target_audience)
                     else:
@@ -201,19 +296,13 @@ def interactive_add():
                 
         elif choice == "3":
             # Preview mode
-            module_title = input("Enter module title: ").strip()
-            detailed_description = input("Enter detailed description: ").strip()
-            purpose = input("Enter purpose (optional): ").strip() or None
-            usage_notes = input("Enter usage notes (optional): ").strip() or None
-            target_audience = input("Enter target audience (optional): ").strip() or None
+            module_title = _input("Enter module title: ").strip()
+            detailed_description = _input("Enter detailed description: ").strip()
+            purpose = _input("Enter purpose (optional): ").strip() or None
+            usage_notes = _input("Enter usage notes (optional): ").strip() or None
+            target_audience = _input("Enter target audience (optional): ").strip() or None
             
-            print("\nEnter key metrics (one per line, press Enter twice when done):")
-            key_metrics = []
-            while True:
-                metric = input("  Metric: ").strip()
-                if not metric:
-                    break
-                key_metrics.append(metric)
+            key_metrics = _read_key_metrics(_input)
             
             preview_description(module_title, detailed_description, purpose, key_metrics, usage_notes, target_audience)
             
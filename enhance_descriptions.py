@@ -4,16 +4,56 @@ Script to enhance module descriptions in the database
 This allows you to add detailed, rich descriptions for each module
 """
 
+import atexit
 import psycopg2
+import psycopg2.pool
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import os
+import sys
+import io
+import csv
 import json
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
 load_dotenv()
 
+def dumps_json(obj) -> str:
+    """Serialize to a JSON string, using orjson when it is installed
+    
+    Shared with add_module_description so both scripts store descriptions the same way.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+# Batches larger than this are sent as a single UPDATE ... FROM (VALUES ...)
+EXECUTE_VALUES_THRESHOLD = 20
+# Batches at least this large are COPYed into a temp table first
+COPY_THRESHOLD = 200
+
+# Shared connection pool (created on first use)
+_POOL = None
+
+def _get_pool():
+    """Get the connection pool, creating it if necessary"""
+    global _POOL
+    if _POOL is None:
+        _POOL = psycopg2.pool.ThreadedConnectionPool(1, 8, dsn=os.getenv('DATABASE_URL'))
+        atexit.register(_POOL.closeall)
+    return _POOL
+
 def get_db_connection():
-    """Get database connection"""
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
+    """Get database connection from the pool"""
+    return _get_pool().getconn()
+
+def release_db_connection(conn, close: bool = False):
+    """Return a database connection to the pool (discarding it if close=True)"""
+    _get_pool().putconn(conn, close=close)
 
 def add_detailed_description(object_id: str, detailed_description: str):
     """Add detailed description to a specific module"""
@@ -37,22 +77,63 @@ def add_detailed_description(object_id: str, detailed_description: str):
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
+            release_db_connection(conn)
 
 def add_detailed_descriptions_batch(descriptions: dict):
-    """Add detailed descriptions for multiple modules"""
+    """
+    Add detailed descriptions for multiple modules
+    
+    Values may be Markdown strings or rich description dicts; dicts are
+    serialized to JSON up front so the database section only binds strings.
+    """
+    rows = [
+        (object_id, description if isinstance(description, str) or description is None
+         else dumps_json(description))
+        for object_id, description in descriptions.items()
+    ]
+    
+    failed = True
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        for object_id, description in descriptions.items():
+        if len(rows) >= COPY_THRESHOLD:
+            # Large batches: COPY into a temp table, then one UPDATE ... FROM
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            
             cursor.execute("""
-                UPDATE chatbot.objects 
-                SET description = %s 
-                WHERE object_id = %s
-            """, (description, object_id))
+                CREATE TEMP TABLE _desc_upd (object_id text PRIMARY KEY, description text)
+                ON COMMIT DROP
+            """)
+            cursor.copy_expert("COPY _desc_upd FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute("""
+                UPDATE chatbot.objects AS o
+                SET description = u.description
+                FROM _desc_upd AS u
+                WHERE o.object_id = u.object_id
+            """)
+        elif len(rows) > EXECUTE_VALUES_THRESHOLD:
+            # Single UPDATE ... FROM (VALUES ...) instead of one round-trip per row
+            execute_values(cursor, """
+                UPDATE chatbot.objects AS o
+                SET description = data.description
+                FROM (VALUES %s) AS data(object_id, description)
+                WHERE o.object_id = data.object_id
+            """, rows, page_size=500)
+        else:
+            # Small batches: plan the UPDATE once and reuse it for every row
+            cursor.execute("""
+                PREPARE upd_desc (text, text) AS
+                UPDATE chatbot.objects SET description = $1 WHERE object_id = $2
+            """)
+            for object_id, description in rows:
+                cursor.execute("EXECUTE upd_desc (%s, %s)", (description, object_id))
+            cursor.execute("DEALLOCATE upd_desc")
         
         conn.commit()
+        failed = False
         print(f"✅ Updated {len(descriptions)} module descriptions")
         
     except Exception as e:
@@ -61,13 +142,16 @@ def add_detailed_descriptions_batch(descriptions: dict):
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
+            # A failed batch may leave the session-level upd_desc statement behind
+            release_db_connection(conn, close=failed)
 
 def get_module_info():
     """Get current module information to help you identify what to update"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        # Server-side cursor so rows are printed as they arrive
+        cursor = conn.cursor(name='module_info_cur')
+        cursor.itersize = 500
         
         cursor.execute("""
             SELECT object_id, title, project_name, description
@@ -76,13 +160,16 @@ def get_module_info():
             ORDER BY project_name, title
         """)
         
-        results = cursor.fetchall()
+        results = []
         
         print("📋 Current Modules in Database:")
         print("=" * 80)
         
-        for result in results:
-            object_id, title, project_name, description = result
+        for object_id, title, project_name, description in cursor:
+            # Many workbooks share a project; keep one copy of each name
+            if project_name:
+                project_name = sys.intern(project_name)
+            results.append((object_id, title, project_name, description))
             print(f"\n🔹 {title}")
             print(f"   Project: {project_name}")
             print(f"   ID: {object_id}")
@@ -98,7 +185,7 @@ def get_module_info():
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
+            release_db_connection(conn)
 
 def example_detailed_descriptions():
     """Example of how to structure detailed descriptions"""
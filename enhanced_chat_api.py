@@ -3,34 +3,52 @@
 Enhanced Chat API with ChatGPT-like responses
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
 import os
+import re
+import asyncio
 import logging
-from typing import List, Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import functools
+from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+import asyncpg
 import random
-import json
+import orjson
+import time
+import types
+from collections import defaultdict, deque
 from datetime import datetime
 from src.agent import RWAAgent
+from src.api.cache import TTLCache
 
 # Load environment variables
 load_dotenv()
 
+# Regexes used on every search/chat request, compiled once
+_MODULE_RE = re.compile(r'(\d+\.\d+)')  # module numbers like "13.05"
+_BOLD_RE = re.compile(r'\*\*([^*]+)\*\*')
+_PAREN_RE = re.compile(r'\([^)]+\)')
+
+@functools.lru_cache(maxsize=256)
+def _module_title_re(module_num: str) -> re.Pattern:
+    """Regex capturing the rest of the line after a module number"""
+    return re.compile(rf'{re.escape(module_num)}[^\n]*?(?=\n|$|\(|\*|$)')
+
+# Tableau server details, read from the environment once at startup (a change
+# needs a restart)
+TABLEAU_SERVER = os.getenv('TABLEAU_SERVER', 'https://prod-useast-a.online.tableau.com')
+TABLEAU_SITE_ID = os.getenv('TABLEAU_SITE_ID', 'rwa')
+
 def generate_tableau_url(workbook_id: str, title: str) -> str:
     """Generate proper Tableau URL from workbook ID and title"""
-    # Get Tableau server details from environment
-    tableau_server = os.getenv('TABLEAU_SERVER', 'https://prod-useast-a.online.tableau.com')
-    site_id = os.getenv('TABLEAU_SITE_ID', 'rwa')
-    
-    # Clean the title for URL
-    clean_title = title.replace(' ', '').replace('(', '').replace(')', '').replace('&', 'and')
-    
     # Generate the Tableau URL
     # Format: https://server/#/site/site-id/views/workbook/sheet?iid=1
-    base_url = f"{tableau_server}/#/site/{site_id}/views/{workbook_id}"
+    base_url = f"{TABLEAU_SERVER}/#/site/{TABLEAU_SITE_ID}/views/{workbook_id}"
     
     # Add the sheet name and iid parameter for proper deep linking
     tableau_url = f"{base_url}?iid=1"
@@ -41,26 +59,96 @@ def generate_tableau_url(workbook_id: str, title: str) -> str:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Returning this directly from an endpoint skips FastAPI's jsonable_encoder
+# pass, which otherwise walks every result and history entry in Python
+class RecordJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also serializes asyncpg Records and read-only mappings"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=dict, option=orjson.OPT_NON_STR_KEYS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database pool and AI agent before serving requests, close the pool on shutdown"""
+    try:
+        app.state.pool = await create_db_pool()
+        logger.info("Database pool initialized")
+    except Exception as e:
+        # Requests will retry pool creation on demand
+        logger.error(f"Failed to initialize database pool: {e}")
+    await get_agent()
+    
+    yield
+    
+    if app.state.pool is not None:
+        await app.state.pool.close()
+        app.state.pool = None
+
 app = FastAPI(
     title="RWA Adele Enhanced Chat API",
     description="ChatGPT-like conversational interface for RWA pharmacy data",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# Initialize the AI agent
-agent = None
+# Shared asyncpg connection pool (created in lifespan)
+app.state.pool = None
+_pool_lock = asyncio.Lock()
+
+async def _init_db_connection(conn: asyncpg.Connection):
+    """Decode json/jsonb columns straight into Python objects"""
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(
+            type_name, encoder=lambda v: orjson.dumps(v).decode(), decoder=orjson.loads, schema='pg_catalog'
+        )
+
+async def create_db_pool() -> asyncpg.Pool:
+    """Create the asyncpg connection pool"""
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        raise ValueError("DATABASE_URL not found in environment variables")
+    
+    # Behind PgBouncer/Supavisor in transaction mode consecutive statements may
+    # run on different server connections, so prepared statements can't be cached
+    behind_transaction_pooler = os.getenv('DB_POOL_MODE', '').lower() == 'transaction'
+    
+    return await asyncpg.create_pool(
+        dsn=database_url,
+        min_size=10,
+        max_size=50,
+        max_inactive_connection_lifetime=300,
+        command_timeout=10,
+        statement_cache_size=0 if behind_transaction_pooler else 2048,
+        init=_init_db_connection,
+        server_settings={"application_name": "rwa_adele_api"}
+    )
+
+async def get_db_pool() -> asyncpg.Pool:
+    """Get the connection pool, creating it if startup could not"""
+    if app.state.pool is None:
+        async with _pool_lock:
+            if app.state.pool is None:
+                app.state.pool = await create_db_pool()
+    return app.state.pool
+
+# The AI agent is built once at startup; the lock stops concurrent requests
+# from building duplicate agents if startup initialization failed
+app.state.agent = None
+_agent_lock = asyncio.Lock()
 
-def get_agent():
+async def get_agent():
     """Get or initialize the AI agent"""
-    global agent
-    if agent is None:
-        try:
-            agent = RWAAgent()
-            logger.info("AI Agent initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AI Agent: {e}")
-            return None
-    return agent
+    if app.state.agent is None:
+        async with _agent_lock:
+            if app.state.agent is None:
+                try:
+                    app.state.agent = await asyncio.to_thread(RWAAgent)
+                    logger.info("AI Agent initialized successfully")
+                except Exception as e:
+                    logger.error(f"Failed to initialize AI Agent: {e}")
+                    return None
+    return app.state.agent
 
 # Add CORS middleware
 app.add_middleware(
@@ -71,225 +159,225 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_db_connection():
-    """Get database connection with timeout"""
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment variables")
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip responses except Server-Sent Event streams, which must reach the client per event"""
     
-    return psycopg2.connect(
-        database_url,
-        connect_timeout=10,  # 10 second timeout
-        application_name="rwa_adele_api"
-    )
+    streaming_paths = frozenset({"/chat/stream"})
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.streaming_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress JSON responses (markdown replies, results and history) over 1 KB
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+def _affected_rows(status: str) -> int:
+    """Row count from an asyncpg command status such as 'DELETE 3'"""
+    return int(status.rsplit(' ', 1)[-1])
 
-def search_content_semantic(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+# Search results for repeated phrasings; chatbot.objects changes rarely
+search_cache = TTLCache(maxsize=2048, ttl=120)
+
+# Workbook and project listings, refreshed at most every five minutes per worker
+catalog_cache = TTLCache(maxsize=16, ttl=300)
+
+# News pages keyed on (limit, offset); cleared whenever articles are written or deleted
+news_cache = TTLCache(maxsize=64, ttl=300)
+
+# Agent replies keyed on the normalized message and the last two turns, so
+# repeated questions skip the LLM round trip
+agent_cache = TTLCache(maxsize=1024, ttl=600)
+
+# (second, ISO string) for the response timestamps, reformatted once per second
+_timestamp = (0, "")
+
+def now_iso() -> str:
+    """Current local time as an ISO 8601 string, at one-second resolution"""
+    global _timestamp
+    second = int(time.time())
+    if _timestamp[0] != second:
+        _timestamp = (second, datetime.fromtimestamp(second).isoformat())
+    return _timestamp[1]
+
+# Messages echoed back in conversation_history; older ones are dropped so
+# responses stop growing with the length of the session
+MAX_HISTORY_MESSAGES = 20
+
+def _bounded_history(conversation_history: List[Dict[str, str]], *messages: Dict[str, str]) -> List[Dict[str, str]]:
+    """Append messages to a conversation history, keeping only the most recent ones"""
+    history = deque(conversation_history or (), maxlen=MAX_HISTORY_MESSAGES)
+    history.extend(messages)
+    return list(history)
+
+def _agent_cache_key(message: str, conversation_history: List[Dict[str, str]]) -> tuple:
+    """Cache key for an agent reply to a message in the context of recent turns"""
+    recent_turns = tuple((msg.get("role"), msg.get("content")) for msg in conversation_history[-2:])
+    return (message.lower().strip(), recent_turns)
+
+# Content search, kept as a module constant: asyncpg caches prepared statements
+# per connection keyed by SQL text, so it is parsed and planned once per
+# pooled connection rather than on every request.
+#
+# All three tiers run in one round trip; only the best tier that
+# matched anything is returned, as with the old sequential queries:
+#   3 - exact matches in title (finds "13.05" exactly, not "1.05")
+#   2 - module numbers mentioned in the query, as a whole-word regex on the
+#       title (idx_objects_title_trgm), closest titles first
+#   1 - full-text search over title, description, project and text blob
+#       (backed by idx_objects_fts_gin), plus trigram-similar titles so
+#       misspellings still match (idx_objects_title_trgm). plainto_tsquery
+#       drops stop words and stems; its terms are OR-ed so any meaningful
+#       word matches. Scored by the better of ts_rank_cd and similarity().
+SEARCH_CONTENT_SQL = """
+WITH q AS (
+    SELECT replace(plainto_tsquery('english', $1)::text, '&', '|')::tsquery AS query
+),
+exact AS (
+    SELECT object_type, title, description, project_name, url, text_blob,
+           1.0::float8 AS similarity_score, 3 AS tier
+    FROM chatbot.objects
+    WHERE title ILIKE '%' || $1 || '%'
+    ORDER BY title
+    LIMIT $3
+),
+module AS (
+    SELECT object_type, title, description, project_name, url, text_blob,
+           similarity(title, $1)::float8 AS similarity_score, 2 AS tier
+    FROM chatbot.objects
+    WHERE $2::text IS NOT NULL AND title ~* $2
+    ORDER BY similarity_score DESC, title
+    LIMIT $3
+),
+keyword AS (
+    SELECT object_type, title, description, project_name, url, text_blob,
+           greatest(
+               ts_rank_cd(
+                   to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' ||
+                                          coalesce(project_name, '') || ' ' || coalesce(text_blob, '')),
+                   q.query, 32
+               ),
+               similarity(title, $1)
+           )::float8 AS similarity_score,
+           1 AS tier
+    FROM chatbot.objects, q
+    WHERE to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' ||
+                                 coalesce(project_name, '') || ' ' || coalesce(text_blob, '')) @@ q.query
+       OR title % $1
+    ORDER BY similarity_score DESC, title
+    LIMIT $3
+),
+hits AS (
+    SELECT * FROM exact
+    UNION ALL SELECT * FROM module
+    UNION ALL SELECT * FROM keyword
+)
+SELECT object_type, title, description, project_name, url, text_blob, similarity_score
+FROM hits
+WHERE tier = (SELECT max(tier) FROM hits)
+ORDER BY similarity_score DESC, title
+LIMIT $3
+"""
+
+async def search_content_semantic(query: str, limit: int = 10) -> List[Dict[str, Any]]:
     """Search content using improved semantic similarity with exact match priority"""
+    query_lower = query.lower().strip()
+    cache_key = (query_lower, limit)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query_lower = query.lower()
-        
-        # First, try exact matches in title (highest priority)
-        # This will find "13.05" exactly, not "1.05"
-        exact_match_query = """
-        SELECT 
-            object_type,
-            title,
-            description,
-            project_name,
-            url,
-            text_blob,
-            1.0 as similarity_score
-        FROM chatbot.objects 
-        WHERE title ILIKE %s
-        ORDER BY title
-        LIMIT %s
-        """
-        
-        cursor.execute(exact_match_query, [f"%{query_lower}%", limit])
-        exact_results = cursor.fetchall()
         
-        if exact_results:
-            # If we found exact matches, return them
-            cursor.close()
-            conn.close()
-            return [dict(row) for row in exact_results]
-        
-        # Second, try to extract module numbers from natural language queries
+        # Extract module numbers from natural language queries
         # Look for patterns like "13.20", "13.05", etc.
-        import re
-        module_pattern = r'(\d+\.\d+)'
-        module_matches = re.findall(module_pattern, query_lower)
-        
-        if module_matches:
-            for module_num in module_matches:
-                # Try multiple search patterns for the module number
-                search_patterns = [
-                    f"%{module_num}%",  # Contains the module number
-                    f"{module_num} %",  # Starts with module number
-                    f"% {module_num} %", # Module number in middle
-                    f"% {module_num}",  # Ends with module number
-                ]
-                
-                for pattern in search_patterns:
-                    module_query = """
-                    SELECT 
-                        object_type,
-                        title,
-                        description,
-                        project_name,
-                        url,
-                        text_blob,
-                        1.0 as similarity_score
-                    FROM chatbot.objects 
-                    WHERE title ILIKE %s
-                    ORDER BY title
-                    LIMIT %s
-                    """
-                    
-                    cursor.execute(module_query, [pattern, limit])
-                    module_results = cursor.fetchall()
-                    
-                    if module_results:
-                        cursor.close()
-                        conn.close()
-                        return [dict(row) for row in module_results]
-        
-        # If no exact matches, try partial matches with better scoring
-        # Extract meaningful terms
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'reports', 'data', 'show', 'me', 'find', 'get', 'about', 'what', 'is'}
-        words = [word.strip('.,!?') for word in query_lower.split() if word.strip('.,!?') not in stop_words and len(word.strip('.,!?')) > 1]
-        
-        if not words:
-            cursor.close()
-            conn.close()
-            return []
-        
-        # Build search with better scoring
-        search_query = """
-        SELECT 
-            object_type,
-            title,
-            description,
-            project_name,
-            url,
-            text_blob,
-            CASE 
-                WHEN title ILIKE %s THEN 0.9
-                WHEN title ILIKE %s THEN 0.8
-                WHEN description ILIKE %s THEN 0.6
-                WHEN project_name ILIKE %s THEN 0.4
-                WHEN text_blob ILIKE %s THEN 0.2
-                ELSE 0.1
-            END as similarity_score
-        FROM chatbot.objects 
-        WHERE (
-            title ILIKE %s OR 
-            description ILIKE %s OR 
-            project_name ILIKE %s OR
-            text_blob ILIKE %s
+        module_matches = _MODULE_RE.findall(query_lower)
+        # Whole-word POSIX regex so "13.05" does not also match "113.05"
+        module_regex = (
+            r'\m(' + '|'.join(re.escape(m) for m in module_matches) + r')\M'
+            if module_matches else None
         )
-        ORDER BY similarity_score DESC, title
-        LIMIT %s
-        """
-        
-        # Use the first meaningful word for search
-        search_term = words[0]
-        search_params = [
-            f"%{search_term}%",  # title exact
-            f"%{query_lower}%",  # title partial
-            f"%{search_term}%",  # description
-            f"%{search_term}%",  # project_name
-            f"%{search_term}%",  # text_blob
-            f"%{search_term}%",  # WHERE title
-            f"%{search_term}%",  # WHERE description
-            f"%{search_term}%",  # WHERE project_name
-            f"%{search_term}%",  # WHERE text_blob
-            limit
-        ]
-        
-        cursor.execute(search_query, search_params)
-        results = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            results = await conn.fetch(SEARCH_CONTENT_SQL, query_lower, module_regex, limit)
         
-        return [dict(row) for row in results]
+        # asyncpg Records support .get() and are encoded by FastAPI directly,
+        # so rows are passed through without copying them into dicts
+        search_cache.set(cache_key, results)
+        return list(results)
         
     except Exception as e:
         logger.error(f"Database search error: {e}")
         return []
 
-def get_workbooks() -> List[Dict[str, Any]]:
+async def get_workbooks() -> List[Dict[str, Any]]:
     """Get all workbooks from database"""
+    cached = catalog_cache.get('workbooks')
+    if cached is not None:
+        return cached
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute("""
-            SELECT DISTINCT title, project_name, url
-            FROM chatbot.objects 
-            WHERE object_type = 'workbook'
-            ORDER BY title
-        """)
-        
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # Stream through a server-side cursor in 1000-row batches rather
+            # than buffering the whole result set at once
+            async with conn.transaction():
+                workbooks = [
+                    row
+                    async for row in conn.cursor("""
+                        SELECT DISTINCT title, project_name, url
+                        FROM chatbot.objects 
+                        WHERE object_type = 'workbook'
+                        ORDER BY title
+                    """, prefetch=1000)
+                ]
         
-        return [dict(row) for row in results]
+        catalog_cache.set('workbooks', workbooks)
+        return workbooks
         
     except Exception as e:
         logger.error(f"Database error getting workbooks: {e}")
         return []
 
-def get_projects() -> List[Dict[str, Any]]:
+async def get_projects() -> List[Dict[str, Any]]:
     """Get all projects with their workbooks using real Tableau project names"""
-    conn = None
-    cursor = None
+    cached = catalog_cache.get('projects')
+    if cached is not None:
+        return cached
+    
     try:
         logger.info("Starting get_projects()")
-        conn = get_db_connection()
-        logger.info("Database connection established")
-        
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get all workbooks grouped by real project names
-        logger.info("Executing projects query")
-        cursor.execute("""
-            SELECT project_name, object_id, title, url, description
-            FROM chatbot.objects 
-            WHERE object_type = 'workbook' 
-            AND project_name IS NOT NULL
-            ORDER BY project_name, title
-        """)
+        pool = await get_db_pool()
         
-        results = cursor.fetchall()
-        logger.info(f"Retrieved {len(results)} workbooks from database")
-        
-        # Group workbooks by project
-        projects_dict = {}
-        for row in results:
-            project_name = row['project_name']
-            workbook = {
-                'id': row['object_id'],
-                'title': row['title'],
-                'url': row['url'],
-                'description': row['description'] or ''
-            }
-            
-            if project_name not in projects_dict:
-                projects_dict[project_name] = {
-                    'project_name': project_name,
-                    'workbooks': []
-                }
+        async with pool.acquire() as conn:
+            logger.info("Database connection established")
             
-            projects_dict[project_name]['workbooks'].append(workbook)
-        
-        # Convert to list
-        projects = list(projects_dict.values())
+            # Group workbooks by real project name in Postgres, returning one
+            # row per project already in the API's shape
+            logger.info("Executing projects query")
+            results = await conn.fetch("""
+                SELECT
+                    project_name,
+                    jsonb_agg(
+                        jsonb_build_object(
+                            'id', object_id,
+                            'title', title,
+                            'url', url,
+                            'description', coalesce(description, '')
+                        )
+                        ORDER BY title
+                    ) AS workbooks
+                FROM chatbot.objects 
+                WHERE object_type = 'workbook' 
+                AND project_name IS NOT NULL
+                GROUP BY project_name
+                ORDER BY project_name
+            """)
+        
+        projects = results
+        catalog_cache.set('projects', projects)
         
         logger.info(f"Returning {len(projects)} projects")
         return projects
@@ -298,26 +386,25 @@ def get_projects() -> List[Dict[str, Any]]:
         logger.error(f"Database error getting projects: {e}")
         return []
 
-def get_latest_news() -> List[Dict[str, Any]]:
-    """Get latest news articles from database"""
-    conn = None
-    cursor = None
+async def get_latest_news(limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+    """Get a page of the latest news articles from database"""
+    cached = news_cache.get((limit, offset))
+    if cached is not None:
+        return cached
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get latest news articles from database
-        cursor.execute("""
-            SELECT id, title, summary, url, source, category, published_date
-            FROM chatbot.news_articles 
-            WHERE is_active = TRUE 
-            ORDER BY published_date DESC 
-            LIMIT 10
-        """)
-        
-        results = cursor.fetchall()
-        
-        if not results:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # Get latest news articles from database
+            results = await conn.fetch("""
+                SELECT id, title, summary, url, source, category, published_date
+                FROM chatbot.news_articles 
+                WHERE is_active = TRUE 
+                ORDER BY published_date DESC 
+                LIMIT $1 OFFSET $2
+            """, limit, offset)
+        
+        if not results and offset == 0:
             # Return mock data if no real articles in database
             logger.info("No news articles in database, returning mock data")
             return get_mock_news()
@@ -336,176 +423,196 @@ def get_latest_news() -> List[Dict[str, Any]]:
             })
         
         logger.info(f"Returning {len(news_articles)} news articles from database")
+        news_cache.set((limit, offset), news_articles)
         return news_articles
         
     except Exception as e:
         logger.error(f"Error getting news from database: {e}")
         # Fallback to mock data
         return get_mock_news()
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+# Fallback news, built once and shared read-only between requests
+_MOCK_NEWS = tuple(types.MappingProxyType(article) for article in [
+    {
+        "id": 1,
+        "title": "New Pharmacy Regulations Announced",
+        "summary": "The latest updates to pharmacy regulations have been published, affecting dispensing practices across the UK.",
+        "source": "PharmacyBiz",
+        "url": "https://example.com/news1",
+        "published_date": "2024-01-15T10:30:00Z",
+        "category": "Regulations"
+    },
+    {
+        "id": 2,
+        "title": "NHS Digital Transformation Update",
+        "summary": "NHS continues its digital transformation journey with new tools for community pharmacies.",
+        "source": "NHS",
+        "url": "https://example.com/news2",
+        "published_date": "2024-01-14T14:20:00Z",
+        "category": "Technology"
+    },
+    {
+        "id": 3,
+        "title": "CPE Training Requirements Changed",
+        "summary": "Continuing Professional Education requirements have been updated for pharmacy professionals.",
+        "source": "CPE",
+        "url": "https://example.com/news3",
+        "published_date": "2024-01-13T09:15:00Z",
+        "category": "Education"
+    },
+    {
+        "id": 4,
+        "title": "Medication Shortage Alert",
+        "summary": "Important updates on medication shortages affecting community pharmacies nationwide.",
+        "source": "PharmacyBiz",
+        "url": "https://example.com/news4",
+        "published_date": "2024-01-12T16:45:00Z",
+        "category": "Supply Chain"
+    },
+    {
+        "id": 5,
+        "title": "New Prescription Guidelines",
+        "summary": "Updated guidelines for prescription handling and patient safety measures.",
+        "source": "NHS",
+        "url": "https://example.com/news5",
+        "published_date": "2024-01-11T11:30:00Z",
+        "category": "Clinical"
+    }
+])
 
 def get_mock_news() -> List[Dict[str, Any]]:
     """Get mock news data as fallback"""
-    return [
-        {
-            "id": 1,
-            "title": "New Pharmacy Regulations Announced",
-            "summary": "The latest updates to pharmacy regulations have been published, affecting dispensing practices across the UK.",
-            "source": "PharmacyBiz",
-            "url": "https://example.com/news1",
-            "published_date": "2024-01-15T10:30:00Z",
-            "category": "Regulations"
-        },
-        {
-            "id": 2,
-            "title": "NHS Digital Transformation Update",
-            "summary": "NHS continues its digital transformation journey with new tools for community pharmacies.",
-            "source": "NHS",
-            "url": "https://example.com/news2",
-            "published_date": "2024-01-14T14:20:00Z",
-            "category": "Technology"
-        },
-        {
-            "id": 3,
-            "title": "CPE Training Requirements Changed",
-            "summary": "Continuing Professional Education requirements have been updated for pharmacy professionals.",
-            "source": "CPE",
-            "url": "https://example.com/news3",
-            "published_date": "2024-01-13T09:15:00Z",
-            "category": "Education"
-        },
-        {
-            "id": 4,
-            "title": "Medication Shortage Alert",
-            "summary": "Important updates on medication shortages affecting community pharmacies nationwide.",
-            "source": "PharmacyBiz",
-            "url": "https://example.com/news4",
-            "published_date": "2024-01-12T16:45:00Z",
-            "category": "Supply Chain"
-        },
-        {
-            "id": 5,
-            "title": "New Prescription Guidelines",
-            "summary": "Updated guidelines for prescription handling and patient safety measures.",
-            "source": "NHS",
-            "url": "https://example.com/news5",
-            "published_date": "2024-01-11T11:30:00Z",
-            "category": "Clinical"
-        }
-    ]
+    return list(_MOCK_NEWS)
 
-def store_news_article(article_data: Dict[str, Any]) -> int:
+def _news_article_row(article_data: Dict[str, Any]) -> tuple:
+    """(title, summary, content, url, source, category, published_date) from n8n article data"""
+    return (
+        article_data.get('title', ''),
+        article_data.get('summary', ''),
+        article_data.get('content', ''),
+        article_data.get('url', ''),
+        article_data.get('source', 'Unknown'),
+        article_data.get('category', 'General'),
+        article_data.get('published_date')
+    )
+
+async def store_news_article(article_data: Dict[str, Any]) -> int:
     """Store a news article in the database"""
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Extract fields from article data
+        pool = await get_db_pool()
         title = article_data.get('title', '')
-        summary = article_data.get('summary', '')
-        content = article_data.get('content', '')
-        url = article_data.get('url', '')
-        source = article_data.get('source', 'Unknown')
-        category = article_data.get('category', 'General')
-        published_date = article_data.get('published_date')
-        
-        # Insert article into database
-        cursor.execute("""
-            INSERT INTO chatbot.news_articles 
-            (title, summary, content, url, source, category, published_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (title, summary, content, url, source, category, published_date))
-        
-        article_id = cursor.fetchone()[0]
-        conn.commit()
         
+        # Insert article into database (published_date arrives as an ISO string,
+        # so let Postgres parse it rather than asyncpg's timestamp codec)
+        async with pool.acquire() as conn:
+            article_id = await conn.fetchval("""
+                INSERT INTO chatbot.news_articles 
+                (title, summary, content, url, source, category, published_date)
+                VALUES ($1, $2, $3, $4, $5, $6, $7::text::timestamptz)
+                RETURNING id
+            """, *_news_article_row(article_data))
+        
+        news_cache.clear()
         logger.info(f"Stored news article: {title} (ID: {article_id})")
         return article_id
         
     except Exception as e:
         logger.error(f"Error storing news article: {e}")
-        if conn:
-            conn.rollback()
         raise
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 # ChatGPT-like response templates
 RESPONSE_TEMPLATES = {
-    "greeting": [
+    "greeting": (
         "Hello! I'm RWA Adele, your intelligent assistant for finding pharmacy reports. How can I help you today?",
         "Hi there! I'm here to help you find the right pharmacy reports and data. What are you looking for?",
         "Welcome! I'm RWA Adele, your personal intelligence assistant for RWA Reports. What can I help you discover today?",
         "Good to see you! I'm here to help you navigate through our pharmacy reports. What information do you need?"
-    ],
-    "found_results": [
+    ),
+    "found_results": (
         "I found some great reports for you! Here's what I discovered:",
         "Perfect! I've located some relevant pharmacy reports that match your query:",
         "Great question! I found several reports that should help you:",
         "Excellent! Here are the reports I found that relate to your search:",
         "I've got some useful reports for you! Take a look at these:"
-    ],
-    "no_results": [
+    ),
+    "no_results": (
         "I couldn't find any reports matching that search. Could you try different keywords or be more specific?",
         "Hmm, I don't see any reports that match your query. Maybe try searching for related terms?",
         "I didn't find any results for that search. Would you like to try a different approach?",
         "No reports found for that query. Let me know if you'd like to search for something else!"
-    ],
-    "follow_up": [
+    ),
+    "follow_up": (
         "Is there anything specific about these reports you'd like to know more about?",
         "Would you like me to explain any of these reports in more detail?",
         "Do any of these reports look like what you were searching for?",
         "Feel free to ask me about any of these reports or search for something else!"
-    ]
+    )
 }
 
+# Dedicated generator for picking response templates
+_RNG = random.Random()
+
+# Intent vocabularies for generate_chat_response. Single words are matched
+# against the query's tokens (so "hi" no longer matches "this"); multi-word
+# phrases are matched as substrings.
+_WORD_RE = re.compile(r"\w+")
+_AMBIGUOUS_WORDS = frozenset({"it", "this", "that"})
+_AMBIGUOUS_PHRASES = frozenset({"the module", "the report"})
+_DETAIL_WORDS = frozenset({"explain", "describe"})
+_DETAIL_PHRASES = frozenset({"what is", "tell me about", "about this", "what does this", "in this report", "details about"})
+_GREETING_WORDS = frozenset({"hello", "hi", "hey"})
+_GREETING_PHRASES = frozenset({"good morning", "good afternoon", "good evening"})
+_THANKS_WORDS = frozenset({"thank", "thanks", "appreciate"})
+_OVERVIEW_PHRASES = frozenset({"what can you do", "help me", "what reports", "show me all", "list all"})
+_SPECIFIC_WORDS = frozenset({"explain", "describe"})
+_SPECIFIC_PHRASES = frozenset({"what is", "tell me about", "about the"})
+_SEARCH_WORDS = frozenset({"find", "search", "need"})
+_SEARCH_PHRASES = frozenset({"where is", "how do i"})
+
+# References back to an earlier module in chat_endpoint, longest alternatives first
+_AMBIGUOUS_REF_RE = re.compile(
+    r"\b(?:tell me about it|details on it|the module|the report|explain it|this|that|it)\b"
+)
+
+def _has_intent(query_lower: str, tokens: set, words: frozenset = frozenset(), phrases: frozenset = frozenset()) -> bool:
+    """Check a query for any of the given words (as tokens) or phrases (as substrings)"""
+    return not words.isdisjoint(tokens) or any(phrase in query_lower for phrase in phrases)
+
 def generate_chat_response(query: str, results: List[Dict[str, Any]], conversation_history: List[Dict[str, str]] = None) -> str:
     """Generate an intelligent ChatGPT-like conversational response with context"""
     
     query_lower = query.lower()
+    tokens = set(_WORD_RE.findall(query_lower))
     
     # Check for ambiguous references that need clarification
-    ambiguous_references = any(phrase in query_lower for phrase in ["it", "this", "that", "the module", "the report", "details on it", "tell me about it", "explain it"])
-    
-    if ambiguous_references:
+    if _has_intent(query_lower, tokens, _AMBIGUOUS_WORDS, _AMBIGUOUS_PHRASES):
         return handle_ambiguous_reference(query, conversation_history)
     
     # Check if user is asking for details about a specific module
-    asking_for_details = any(phrase in query_lower for phrase in ["what is", "tell me about", "explain", "describe", "about this", "what does this", "in this report", "details about"])
+    asking_for_details = _has_intent(query_lower, tokens, _DETAIL_WORDS, _DETAIL_PHRASES)
     
     # If asking for details and we have results, provide detailed response
     if asking_for_details and results:
         return generate_detailed_module_response(results[0])
     
     # Check if it's a greeting
-    greeting_words = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]
-    if any(word in query_lower for word in greeting_words):
-        return random.choice(RESPONSE_TEMPLATES["greeting"])
+    if _has_intent(query_lower, tokens, _GREETING_WORDS, _GREETING_PHRASES):
+        return _RNG.choice(RESPONSE_TEMPLATES["greeting"])
     
     # Check if it's a thank you
-    if any(word in query_lower for word in ["thank", "thanks", "appreciate"]):
+    if _has_intent(query_lower, tokens, _THANKS_WORDS):
         return "You're very welcome! I'm here whenever you need help finding pharmacy reports. Is there anything else I can help you with?"
     
     # Check if user is asking for general help or overview
-    if any(phrase in query_lower for phrase in ["what can you do", "help me", "what reports", "show me all", "list all"]):
+    if _has_intent(query_lower, tokens, phrases=_OVERVIEW_PHRASES):
         return generate_overview_response(results)
     
     # Check if user is asking about a specific module/report
-    if any(phrase in query_lower for phrase in ["what is", "tell me about", "explain", "describe", "about the"]):
+    if _has_intent(query_lower, tokens, _SPECIFIC_WORDS, _SPECIFIC_PHRASES):
         return generate_specific_module_response(query, results)
     
     # Check if user is looking for something specific
-    if any(phrase in query_lower for phrase in ["find", "search", "where is", "how do i", "need"]):
+    if _has_intent(query_lower, tokens, _SEARCH_WORDS, _SEARCH_PHRASES):
         return generate_search_response(query, results)
     
     # Generate response based on results
@@ -515,33 +622,89 @@ def generate_chat_response(query: str, results: List[Dict[str, Any]], conversati
     # Default intelligent response
     return generate_intelligent_response(query, results)
 
+@functools.lru_cache(maxsize=4096)
+def _parse_rich_description(description: str) -> Optional[dict]:
+    """Parse a JSON rich description, returning None for plain-text descriptions"""
+    try:
+        parsed = orjson.loads(description)
+    except orjson.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+# Line templates for generate_overview_response
+_PROJECT_HEADER = "**{}** ({} reports)".format
+_WORKBOOK_LINE = "  • {}".format
+_MORE_LINE = "  • ... and {} more".format
+
 def generate_overview_response(results: List[Dict[str, Any]]) -> str:
     """Generate an overview of available reports"""
     if not results:
         return "I can help you find pharmacy reports! Here are the main categories available:\n\n• **Financial Reports** - Sales, margins, reimbursements\n• **Patient Reports** - Profiling, compliance, deliveries\n• **Product Reports** - Dispensing, stock, compliance\n• **Operational Reports** - Staff productivity, workflows\n• **Clinical Reports** - MUR, NMS, health services\n\nWhat specific area are you interested in?"
     
     # Group results by project
-    projects = {}
+    projects = defaultdict(list)
     for result in results:
-        project_name = result.get('project_name', 'Other')
-        if project_name not in projects:
-            projects[project_name] = []
-        projects[project_name].append(result)
+        projects[result.get('project_name', 'Other')].append(result)
     
     response_parts = ["Here are the main report categories I can help you with:\n"]
     
     for project_name, workbooks in projects.items():
-        response_parts.append(f"**{project_name}** ({len(workbooks)} reports)")
-        for workbook in workbooks[:3]:  # Show first 3
-            response_parts.append(f"  • {workbook.get('title', 'Untitled')}")
+        response_parts.append(_PROJECT_HEADER(project_name, len(workbooks)))
+        response_parts.extend(_WORKBOOK_LINE(workbook.get('title', 'Untitled')) for workbook in workbooks[:3])  # Show first 3
         if len(workbooks) > 3:
-            response_parts.append(f"  • ... and {len(workbooks) - 3} more")
+            response_parts.append(_MORE_LINE(len(workbooks) - 3))
         response_parts.append("")
     
     response_parts.append("What specific report or category would you like to know more about?")
     
     return "\n".join(response_parts)
 
+def _build_category_index(categories: tuple) -> tuple:
+    """(keyword regex, keyword -> (priority, *category details)); earlier categories win
+    
+    Keywords match anywhere in a title, as substrings ("Healthcare",
+    "Patient_Services"). The regex is a lookahead so overlapping keywords are
+    all seen, with keywords in priority order so that at any one position the
+    best category's keyword is the one captured.
+    """
+    index = {}
+    for priority, (keywords, *details) in enumerate(categories):
+        for keyword in keywords:
+            index.setdefault(keyword, (priority, *details))
+    pattern = re.compile("(?=(" + "|".join(map(re.escape, index)) + "))")
+    return pattern, index
+
+# Title keywords used to describe modules that have no rich description
+_SUMMARY_CATEGORY_INDEX = _build_category_index((
+    (("financial", "sales", "margin"), "financial performance"),
+    (("patient", "customer"), "patient management"),
+    (("product", "dispensing"), "product operations"),
+    (("clinical", "mur", "nms"), "clinical services"),
+))
+_DETAILED_CATEGORY_INDEX = _build_category_index((
+    (("financial", "sales", "margin", "revenue", "cost"),
+     "financial performance and reporting",
+     "tracks financial metrics, sales data, margins, and revenue analysis"),
+    (("patient", "care", "service", "clinical", "nms", "mur"),
+     "patient care and clinical services",
+     "monitors patient care delivery, clinical services, and health outcomes"),
+    (("stock", "inventory", "product", "dispensing"),
+     "inventory and product management",
+     "manages stock levels, product performance, and dispensing operations"),
+    (("staff", "productivity", "performance", "management"),
+     "staff performance and management",
+     "tracks staff productivity, performance metrics, and operational efficiency"),
+    (("compliance", "regulatory", "audit", "quality"),
+     "compliance and quality assurance",
+     "ensures regulatory compliance, quality standards, and audit requirements"),
+))
+
+def _classify_title(title: str, category_index: tuple) -> Optional[tuple]:
+    """Find the highest-priority category whose keywords appear in a module title"""
+    pattern, index = category_index
+    hits = [index[keyword] for keyword in pattern.findall(title.lower())]
+    return min(hits) if hits else None
+
 def generate_specific_module_response(query: str, results: List[Dict[str, Any]]) -> str:
     """Generate detailed information about a specific module"""
     if not results:
@@ -558,20 +721,14 @@ def generate_specific_module_response(query: str, results: List[Dict[str, Any]])
     asking_for_details = any(phrase in query_lower for phrase in ["details", "tell me about", "explain", "describe", "what is"])
     
     # Try to parse rich description if it's JSON
-    rich_description = None
-    if description:
-        try:
-            import json
-            rich_description = json.loads(description)
-        except:
-            pass
+    rich_description = _parse_rich_description(description) if description else None
     
     # Generate detailed response if user asks for details
     if asking_for_details:
         return generate_detailed_module_response(best_match)
     
     # Generate a short, clean summary for other queries
-    if rich_description and isinstance(rich_description, dict):
+    if rich_description is not None:
         # Extract just the overview/purpose for short response
         overview = rich_description.get('detailed_description', '')
         if overview:
@@ -587,62 +744,54 @@ def generate_specific_module_response(query: str, results: List[Dict[str, Any]])
         return f"**{title}**\n\n{short_desc}\n\n*({project_name})*"
     
     # Generate basic response
-    title_lower = title.lower()
-    if any(word in title_lower for word in ["financial", "sales", "margin"]):
-        category = "financial performance"
-    elif any(word in title_lower for word in ["patient", "customer"]):
-        category = "patient management"
-    elif any(word in title_lower for word in ["product", "dispensing"]):
-        category = "product operations"
-    elif any(word in title_lower for word in ["clinical", "mur", "nms"]):
-        category = "clinical services"
-    else:
-        category = "pharmacy operations"
+    match = _classify_title(title, _SUMMARY_CATEGORY_INDEX)
+    category = match[1] if match else "pharmacy operations"
     
     return f"**{title}**\n\nProvides insights into {category} and reporting.\n\n*({project_name})*"
 
+def _module_title_from(module_num: str, content: str) -> str:
+    """Extract the full module title following a module number in a message"""
+    title_match = _module_title_re(module_num).search(content)
+    if not title_match:
+        return f"{module_num} Module"
+    
+    title = title_match.group(0).strip()
+    # Clean up the title
+    title = _BOLD_RE.sub(r'\1', title)  # Remove bold formatting
+    title = _PAREN_RE.sub('', title)  # Remove parenthetical info
+    return title.strip()
+
 def handle_ambiguous_reference(query: str, conversation_history: List[Dict[str, str]] = None) -> str:
     """Handle ambiguous references like 'it', 'this', 'that' by asking for clarification"""
     
     if not conversation_history:
         return "I'd be happy to help! Could you please specify which module or report you'd like details about? You can mention the module number (like 2.30) or describe what you're looking for."
     
-    # Extract recently mentioned modules from conversation history
+    # Extract recently mentioned modules from conversation history in one pass
+    # over the last 6 messages. Modules named by the assistant come first (with
+    # their titles); modules only the user mentioned are appended after them.
     recent_modules = []
+    seen = set()
+    user_mentions = []
     
-    # Look through the last 6 messages for module references
     for msg in reversed(conversation_history[-6:]):
-        if msg.get("role") == "assistant" and msg.get("content"):
-            content = msg["content"]
+        content = msg.get("content")
+        if not content:
+            continue
+        role = msg.get("role")
+        if role == "assistant":
             # Look for module patterns like "2.30", "13.20", etc.
-            import re
-            module_pattern = r'(\d+\.\d+)'
-            matches = re.findall(module_pattern, content)
-            for match in matches:
-                if match not in [m[0] for m in recent_modules]:
-                    # Try to extract the full title with better pattern
-                    title_pattern = rf'{re.escape(match)}[^\n]*?(?=\n|$|\(|\*|$)'
-                    title_match = re.search(title_pattern, content)
-                    if title_match:
-                        title = title_match.group(0).strip()
-                        # Clean up the title
-                        title = re.sub(r'\*\*([^*]+)\*\*', r'\1', title)  # Remove bold formatting
-                        title = re.sub(r'\([^)]+\)', '', title)  # Remove parenthetical info
-                        title = title.strip()
-                    else:
-                        title = f"{match} Module"
-                    recent_modules.append((match, title))
+            for match in _MODULE_RE.findall(content):
+                if match not in seen:
+                    seen.add(match)
+                    recent_modules.append((match, _module_title_from(match, content)))
+        elif role == "user":
+            user_mentions.extend(_MODULE_RE.findall(content))
     
-    # Also look for modules mentioned by the user
-    for msg in reversed(conversation_history[-6:]):
-        if msg.get("role") == "user" and msg.get("content"):
-            content = msg["content"]
-            import re
-            module_pattern = r'(\d+\.\d+)'
-            matches = re.findall(module_pattern, content)
-            for match in matches:
-                if match not in [m[0] for m in recent_modules]:
-                    recent_modules.append((match, f"{match} Module"))
+    for match in user_mentions:
+        if match not in seen:
+            seen.add(match)
+            recent_modules.append((match, f"{match} Module"))
     
     if not recent_modules:
         return "I'd be happy to help! Could you please specify which module or report you'd like details about? You can mention the module number (like 2.30) or describe what you're looking for."
@@ -670,105 +819,104 @@ def generate_detailed_module_response(result: Dict[str, Any]) -> str:
     project_name = result.get('project_name', 'Unknown')
     
     # Try to parse rich description
-    if description:
-        try:
-            import json
-            rich_desc = json.loads(description)
-            if isinstance(rich_desc, dict):
-                response_parts = [f"**{title}**\n"]
-                
-                # Add detailed description
-                if rich_desc.get('detailed_description'):
-                    response_parts.append(f"{rich_desc['detailed_description']}\n")
-                
-                # Add purpose
-                if rich_desc.get('purpose'):
-                    response_parts.append(f"**Purpose:**\n{rich_desc['purpose']}\n")
-                
-                # Add key metrics
-                if rich_desc.get('key_metrics'):
-                    metrics = rich_desc['key_metrics']
-                    if isinstance(metrics, list):
-                        response_parts.append(f"**Key Metrics:**\n")
-                        for metric in metrics:
-                            response_parts.append(f"• {metric}")
-                        response_parts.append("")
-                
-                # Add usage notes
-                if rich_desc.get('usage_notes'):
-                    response_parts.append(f"**How to Use:**\n{rich_desc['usage_notes']}\n")
-                
-                # Add target audience
-                if rich_desc.get('target_audience'):
-                    response_parts.append(f"**Target Audience:**\n{rich_desc['target_audience']}\n")
-                
-                response_parts.append(f"*({project_name})*")
-                return "\n".join(response_parts)
-        except Exception as e:
-            print(f"Error parsing rich description: {e}")
-            pass
+    rich_desc = _parse_rich_description(description) if description else None
+    if rich_desc is not None:
+        response_parts = [f"**{title}**\n"]
+        
+        # Add detailed description
+        detailed_description = rich_desc.get('detailed_description')
+        if detailed_description:
+            response_parts.append(f"{detailed_description}\n")
+        
+        # Add purpose
+        purpose = rich_desc.get('purpose')
+        if purpose:
+            response_parts.append(f"**Purpose:**\n{purpose}\n")
+        
+        # Add key metrics
+        metrics = rich_desc.get('key_metrics')
+        if metrics and isinstance(metrics, list):
+            response_parts.append(f"**Key Metrics:**\n")
+            response_parts.extend(f"• {metric}" for metric in metrics)
+            response_parts.append("")
+        
+        # Add usage notes
+        usage_notes = rich_desc.get('usage_notes')
+        if usage_notes:
+            response_parts.append(f"**How to Use:**\n{usage_notes}\n")
+        
+        # Add target audience
+        target_audience = rich_desc.get('target_audience')
+        if target_audience:
+            response_parts.append(f"**Target Audience:**\n{target_audience}\n")
+        
+        response_parts.append(f"*({project_name})*")
+        return "\n".join(response_parts)
     
     # Fallback: Generate intelligent response based on module title and type
-    title_lower = title.lower()
-    
     # Determine module category and generate appropriate description
-    if any(word in title_lower for word in ["financial", "sales", "margin", "revenue", "cost"]):
-        category = "financial performance and reporting"
-        purpose = "tracks financial metrics, sales data, margins, and revenue analysis"
-    elif any(word in title_lower for word in ["patient", "care", "service", "clinical", "nms", "mur"]):
-        category = "patient care and clinical services"
-        purpose = "monitors patient care delivery, clinical services, and health outcomes"
-    elif any(word in title_lower for word in ["stock", "inventory", "product", "dispensing"]):
-        category = "inventory and product management"
-        purpose = "manages stock levels, product performance, and dispensing operations"
-    elif any(word in title_lower for word in ["staff", "productivity", "performance", "management"]):
-        category = "staff performance and management"
-        purpose = "tracks staff productivity, performance metrics, and operational efficiency"
-    elif any(word in title_lower for word in ["compliance", "regulatory", "audit", "quality"]):
-        category = "compliance and quality assurance"
-        purpose = "ensures regulatory compliance, quality standards, and audit requirements"
+    match = _classify_title(title, _DETAILED_CATEGORY_INDEX)
+    if match:
+        _, category, purpose = match
     else:
         category = "pharmacy operations and reporting"
         purpose = "provides insights into pharmacy operations and performance"
     
     return f"**{title}**\n\nThis module focuses on {category}. It {purpose} to help optimize pharmacy operations and decision-making.\n\n*({project_name})*"
 
+# Fixed bodies of the canned responses; only titles and queries are interpolated per call
+_SERVICES_SUMMARY = (
+    "Provides weekly insights into patient care services including MURs, NMS consultations, "
+    "clinical services, and staff productivity metrics.\n\n"
+    "*Helps track service delivery and identify areas for improvement.*"
+)
+_EXECUTIVE_SUMMARY = (
+    "High-level monthly summary for senior management covering financial performance, "
+    "operational KPIs, strategic initiatives, and market analysis.\n\n"
+    "*Essential for board presentations and strategic decision-making.*"
+)
+_NO_RESULTS_SUGGESTIONS = (
+    "Here are some suggestions:\n\n"
+    "• Check the sidebar for available report categories\n"
+    "• Try searching for broader terms like 'financial', 'patient', or 'product'\n"
+    "• Ask me about specific report types like 'MUR reports' or 'sales data'\n\n"
+    "What would you like to explore?"
+)
+
 def generate_detailed_services_response(result: Dict[str, Any]) -> str:
     """Generate detailed response about Weekly Services Report"""
     title = result.get('title', 'Weekly Services Report')
-    return f"**{title}**\n\nProvides weekly insights into patient care services including MURs, NMS consultations, clinical services, and staff productivity metrics.\n\n*Helps track service delivery and identify areas for improvement.*"
+    return f"**{title}**\n\n{_SERVICES_SUMMARY}"
 
 def generate_detailed_executive_response(result: Dict[str, Any]) -> str:
     """Generate detailed response about Executive Report"""
     title = result.get('title', 'Executive Monthly Report')
-    return f"**{title}**\n\nHigh-level monthly summary for senior management covering financial performance, operational KPIs, strategic initiatives, and market analysis.\n\n*Essential for board presentations and strategic decision-making.*"
+    return f"**{title}**\n\n{_EXECUTIVE_SUMMARY}"
+
+def _result_fields(results: List[Dict[str, Any]]):
+    """Yield (title, description, project_name) for each search result, with listing defaults"""
+    for result in results:
+        yield result.get('title', 'Untitled'), result.get('description', ''), result.get('project_name', 'Unknown')
 
 def generate_search_response(query: str, results: List[Dict[str, Any]]) -> str:
     """Generate response for search queries"""
     if not results:
         return f"I couldn't find any reports matching '{query}'. Try checking the sidebar for available categories or rephrasing your search."
     
-    response_parts = [f"I found {len(results)} report(s) related to '{query}':\n"]
-    
-    for i, result in enumerate(results, 1):
-        title = result.get('title', 'Untitled')
-        description = result.get('description', '')
-        project_name = result.get('project_name', 'Unknown')
-        
-        result_text = f"**{title}**"
-        if description:
-            result_text += f" - {description}"
-        result_text += f" ({project_name})"
-        
-        response_parts.append(f"{i}. {result_text}")
-    
-    response_parts.append("\nWould you like more details about any of these reports?")
+    result_lines = "\n".join(
+        f"{i}. **{title}**{' - ' + description if description else ''} ({project_name})"
+        for i, (title, description, project_name) in enumerate(_result_fields(results), 1)
+    )
     
-    return "\n".join(response_parts)
+    return (
+        f"I found {len(results)} report(s) related to '{query}':\n\n"
+        f"{result_lines}\n"
+        "\nWould you like more details about any of these reports?"
+    )
 
 def generate_no_results_response(query: str) -> str:
     """Generate response when no results are found"""
-    return f"I couldn't find any reports matching '{query}'. Here are some suggestions:\n\n• Check the sidebar for available report categories\n• Try searching for broader terms like 'financial', 'patient', or 'product'\n• Ask me about specific report types like 'MUR reports' or 'sales data'\n\nWhat would you like to explore?"
+    return f"I couldn't find any reports matching '{query}'. {_NO_RESULTS_SUGGESTIONS}"
 
 def generate_intelligent_response(query: str, results: List[Dict[str, Any]]) -> str:
     """Generate an intelligent response based on query and results"""
@@ -782,21 +930,36 @@ def generate_intelligent_response(query: str, results: List[Dict[str, Any]]) ->
         return generate_overview_response(results)
     
     # Show all results with clean formatting
-    response_parts = [f"Found {len(results)} relevant reports:\n"]
+    result_lines = "\n\n".join(
+        f"**{i}. {title}**\n   *({project_name})*"
+        for i, (title, _, project_name) in enumerate(_result_fields(results), 1)
+    )
     
-    for i, result in enumerate(results, 1):
-        title = result.get('title', 'Untitled')
-        project_name = result.get('project_name', 'Unknown')
-        
-        response_parts.append(f"**{i}. {title}**")
-        response_parts.append(f"   *({project_name})*")
-        
-        if i < len(results):
-            response_parts.append("")
+    return f"Found {len(results)} relevant reports:\n\n{result_lines}\n\nAsk about any specific report for details!"
+
+# Request models; oversized input or a bad limit is rejected with a 422 before
+# the handlers run. Input is stripped, and an empty query or message still gets
+# the handlers' friendly reply rather than an error
+class SearchRequest(BaseModel):
+    query: str = Field("", max_length=2000, description="Search query string")
+    limit: int = Field(10, ge=1, le=100, description="Maximum number of results")
+    conversation_history: List[Dict[str, Any]] = Field(default_factory=list, description="Previous chat messages")
     
-    response_parts.append("\nAsk about any specific report for details!")
+    @field_validator('query', mode='before')
+    @classmethod
+    def strip_query(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+
+class ChatRequest(BaseModel):
+    message: str = Field("", max_length=2000, description="User message")
+    conversation_history: List[Dict[str, Any]] = Field(default_factory=list, description="Previous chat messages")
+    use_agent: bool = Field(True, description="Answer with the AI agent, falling back to search")
     
-    return "\n".join(response_parts)
+    @field_validator('message', mode='before')
+    @classmethod
+    def strip_message(cls, value):
+        return value.strip() if isinstance(value, str) else value
 
 @app.get("/")
 async def root():
@@ -808,12 +971,15 @@ async def health():
     """Health check endpoint"""
     try:
         # Test database connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM chatbot.objects")
-        count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # The planner's row estimate is a catalog lookup rather than a full
+            # scan on every probe; it is only -1 before the first ANALYZE
+            count = await conn.fetchval(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = 'chatbot.objects'::regclass"
+            )
+            if count < 0:
+                count = await conn.fetchval("SELECT COUNT(*) FROM chatbot.objects")
         
         return {
             "status": "healthy",
@@ -831,21 +997,23 @@ async def health():
         }
 
 @app.get("/workbooks")
-async def get_workbooks_endpoint():
+async def get_workbooks_endpoint(response: Response):
     """Get all workbooks"""
     try:
-        workbooks = get_workbooks()
+        workbooks = await get_workbooks()
+        response.headers["Cache-Control"] = "max-age=60"
         return {"workbooks": workbooks, "count": len(workbooks)}
     except Exception as e:
         logger.error(f"Error getting workbooks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/projects")
-async def get_projects_endpoint():
+async def get_projects_endpoint(response: Response):
     """Get all projects with their workbooks"""
     try:
         logger.info("Projects endpoint called")
-        projects = get_projects()
+        projects = await get_projects()
+        response.headers["Cache-Control"] = "max-age=60"
         logger.info(f"Returning {len(projects)} projects to client")
         return {"projects": projects, "count": len(projects)}
     except Exception as e:
@@ -853,13 +1021,13 @@ async def get_projects_endpoint():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/news")
-async def get_news_endpoint():
+async def get_news_endpoint(limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0)):
     """Get latest news articles from n8n workflow"""
     try:
         logger.info("News endpoint called")
-        news = get_latest_news()
+        news = await get_latest_news(limit, offset)
         logger.info(f"Returning {len(news)} news articles to client")
-        return {"news": news, "count": len(news)}
+        return RecordJSONResponse({"news": news, "count": len(news)}, headers={"Cache-Control": "max-age=60"})
     except Exception as e:
         logger.error(f"Error getting news: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -872,21 +1040,28 @@ async def news_webhook_endpoint(request: Dict[str, Any]):
         
         # Check if this is a batch of articles (array) or single article
         if "articles" in request:
-            # Batch processing - clear all existing articles first
-            logger.info("Batch processing detected - clearing existing articles")
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM chatbot.news_articles")
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logger.info("Cleared all existing articles")
-            
-            # Process each article in the batch
-            article_ids = []
-            for article_data in request["articles"]:
-                article_id = store_news_article(article_data)
-                article_ids.append(article_id)
+            # Batch processing - replace all existing articles, in one
+            # transaction so a failed insert leaves the old articles in place
+            logger.info("Batch processing detected - replacing existing articles")
+            columns = list(zip(*map(_news_article_row, request["articles"]))) or [()] * 7
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("DELETE FROM chatbot.news_articles")
+                    # One INSERT for the whole batch, in article order, so the
+                    # serial IDs come back in that order too
+                    rows = await conn.fetch("""
+                        INSERT INTO chatbot.news_articles 
+                        (title, summary, content, url, source, category, published_date)
+                        SELECT title, summary, content, url, source, category, published_date::timestamptz
+                        FROM unnest($1::text[], $2::text[], $3::text[], $4::text[],
+                                    $5::text[], $6::text[], $7::text[])
+                             WITH ORDINALITY AS a(title, summary, content, url, source, category, published_date, ord)
+                        ORDER BY ord
+                        RETURNING id
+                    """, *map(list, columns))
+            news_cache.clear()
+            article_ids = [row["id"] for row in rows]
             
             logger.info(f"Stored {len(article_ids)} news articles with IDs: {article_ids}")
             return {"status": "success", "article_ids": article_ids, "message": f"Stored {len(article_ids)} articles successfully"}
@@ -898,7 +1073,7 @@ async def news_webhook_endpoint(request: Dict[str, Any]):
                 raise HTTPException(status_code=400, detail="No article data provided")
             
             # Store article in database
-            article_id = store_news_article(article_data)
+            article_id = await store_news_article(article_data)
             
             logger.info(f"Stored news article with ID: {article_id}")
             return {"status": "success", "article_id": article_id, "message": "Article stored successfully"}
@@ -908,122 +1083,188 @@ async def news_webhook_endpoint(request: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/search")
-async def search_endpoint(request: Dict[str, Any]):
+async def search_endpoint(request: SearchRequest):
     """Search for content with ChatGPT-like responses"""
     try:
-        query = request.get("query", "")
-        limit = request.get("limit", 10)
-        conversation_history = request.get("conversation_history", [])
+        query = request.query
+        limit = request.limit
+        conversation_history = request.conversation_history
         
         if not query:
             return {"results": [], "count": 0, "message": "No query provided"}
         
         # Search for content
-        results = search_content_semantic(query, limit)
+        results = await search_content_semantic(query, limit)
         
         # Generate ChatGPT-like response
         chat_response = generate_chat_response(query, results, conversation_history)
         
-        return {
+        return RecordJSONResponse({
             "results": results,
             "count": len(results),
             "query": query,
             "chat_response": chat_response,
             "search_type": "semantic",
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": now_iso()
+        })
         
     except Exception as e:
         logger.error(f"Search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def search_chat_reply(message: str, conversation_history: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Answer a chat message from database search alone, without the AI agent"""
+    # Check for ambiguous references first, before searching
+    message_lower = message.lower()
+    ambiguous_references = _AMBIGUOUS_REF_RE.search(message_lower) is not None
+    
+    if ambiguous_references:
+        chat_response = handle_ambiguous_reference(message, conversation_history)
+        results = []
+    else:
+        # Search for content
+        results = await search_content_semantic(message, 5)
+        
+        # Generate ChatGPT-like response with database grounding
+        chat_response = generate_chat_response(message, results, conversation_history)
+    
+    return {
+        "response": chat_response,
+        "results": results,
+        "conversation_history": _bounded_history(
+            conversation_history,
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": chat_response}
+        ),
+        "timestamp": now_iso(),
+        "agent_used": False
+    }
+
 @app.post("/chat")
-async def chat_endpoint(request: Dict[str, Any]):
+async def chat_endpoint(request: ChatRequest):
     """Enhanced chat endpoint with AI agent"""
     try:
-        message = request.get("message", "")
-        conversation_history = request.get("conversation_history", [])
-        use_agent = request.get("use_agent", True)  # Default to using agent
+        message = request.message
+        conversation_history = request.conversation_history
+        use_agent = request.use_agent
         
         if not message:
             return {"response": "I didn't receive a message. Could you please try again?", "conversation_history": conversation_history}
         
         # Try to use AI agent first
         if use_agent:
-            agent_instance = get_agent()
+            cache_key = _agent_cache_key(message, conversation_history)
+            cached_response = agent_cache.get(cache_key)
+            if cached_response is not None:
+                return RecordJSONResponse({
+                    "response": cached_response,
+                    "results": [],
+                    "conversation_history": _bounded_history(
+                        conversation_history,
+                        {"role": "user", "content": message},
+                        {"role": "assistant", "content": cached_response}
+                    ),
+                    "timestamp": now_iso(),
+                    "agent_used": True
+                })
+            
+            agent_instance = await get_agent()
             if agent_instance:
                 try:
-                    result = agent_instance.chat(message, conversation_history)
-                    return {
+                    # Awaits the model call; the agent's database steps run in worker threads
+                    result = await agent_instance.achat(message, conversation_history)
+                    # The agent reports agent_used=False when it answered with an error message
+                    if result.get("agent_used"):
+                        agent_cache.set(cache_key, result["response"])
+                    return RecordJSONResponse({
                         "response": result["response"],
                         "results": [],
-                        "conversation_history": result["conversation_history"],
-                        "timestamp": datetime.now().isoformat(),
+                        "conversation_history": _bounded_history(result["conversation_history"]),
+                        "timestamp": now_iso(),
                         "agent_used": True
-                    }
+                    })
                 except Exception as e:
                     logger.error(f"Agent error: {e}, falling back to simple search")
                     # Fall back to simple search if agent fails
         
         # Fallback to original logic with better grounding
-        # Check for ambiguous references first, before searching
-        message_lower = message.lower()
-        ambiguous_references = any(phrase in message_lower for phrase in ["it", "this", "that", "the module", "the report", "details on it", "tell me about it", "explain it"])
-        
-        if ambiguous_references:
-            chat_response = handle_ambiguous_reference(message, conversation_history)
-            # Update conversation history
-            conversation_history.append({"role": "user", "content": message})
-            conversation_history.append({"role": "assistant", "content": chat_response})
-            
-            return {
-                "response": chat_response,
-                "results": [],
-                "conversation_history": conversation_history,
-                "timestamp": datetime.now().isoformat(),
-                "agent_used": False
-            }
-        
-        # Search for content
-        results = search_content_semantic(message, 5)
-        
-        # Generate ChatGPT-like response with database grounding
-        chat_response = generate_chat_response(message, results, conversation_history)
-        
-        # Update conversation history
-        conversation_history.append({"role": "user", "content": message})
-        conversation_history.append({"role": "assistant", "content": chat_response})
-        
-        return {
-            "response": chat_response,
-            "results": results,
-            "conversation_history": conversation_history,
-            "timestamp": datetime.now().isoformat(),
-            "agent_used": False
-        }
+        return RecordJSONResponse(await search_chat_reply(message, conversation_history))
         
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(payload: Dict[str, Any]) -> bytes:
+    """Encode a payload as one Server-Sent Events data frame"""
+    return b"data: " + orjson.dumps(payload, default=dict, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Chat endpoint streaming the agent's reply as Server-Sent Events
+    
+    Emits {"delta": text} frames while the model generates, then a final
+    {"done": true, ...} frame with the same fields /chat returns.
+    """
+    message = request.message
+    conversation_history = request.conversation_history
+    
+    if not message:
+        raise HTTPException(status_code=400, detail="No message provided")
+    
+    async def event_stream():
+        cache_key = _agent_cache_key(message, conversation_history)
+        cached_response = agent_cache.get(cache_key)
+        if cached_response is not None:
+            yield _sse_event({
+                "done": True,
+                "response": cached_response,
+                "results": [],
+                "conversation_history": _bounded_history(
+                    conversation_history,
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": cached_response}
+                ),
+                "timestamp": now_iso(),
+                "agent_used": True
+            })
+            return
+        
+        agent_instance = await get_agent()
+        if agent_instance is None:
+            reply = await search_chat_reply(message, conversation_history)
+            yield _sse_event({"done": True, **reply})
+            return
+        
+        async for event in agent_instance.achat_stream(message, conversation_history):
+            if event.get("done"):
+                if event["agent_used"]:
+                    agent_cache.set(cache_key, event["response"])
+                event.update(
+                    results=[],
+                    conversation_history=_bounded_history(event["conversation_history"]),
+                    timestamp=now_iso()
+                )
+            yield _sse_event(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/news/{article_id}")
 async def delete_news_article(article_id: int):
     """Delete a news article by ID"""
     try:
         logger.info(f"Deleting news article with ID: {article_id}")
         
-        # Connect to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Delete the article
-        cursor.execute("DELETE FROM chatbot.news_articles WHERE id = %s", (article_id,))
-        conn.commit()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            status = await conn.execute("DELETE FROM chatbot.news_articles WHERE id = $1", article_id)
+        news_cache.clear()
         
-        cursor.close()
-        conn.close()
-        
-        logger.info(f"Successfully deleted news article with ID: {article_id}")
+        logger.info(f"Deleted {_affected_rows(status)} news article(s) with ID: {article_id}")
         return {"status": "success", "message": f"Article {article_id} deleted successfully"}
         
     except Exception as e:
@@ -1036,23 +1277,18 @@ async def cleanup_test_articles():
     try:
         logger.info("Cleaning up test articles")
         
-        # Connect to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Delete test articles (those with "test" in title or source)
-        cursor.execute("""
-            DELETE FROM chatbot.news_articles 
-            WHERE LOWER(title) LIKE '%test%' 
-            OR LOWER(source) LIKE '%test%'
-            OR LOWER(title) LIKE '%n8n%'
-        """)
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # ILIKE ANY can use the trigram indexes on title and source
+            status = await conn.execute("""
+                DELETE FROM chatbot.news_articles 
+                WHERE title ILIKE ANY($1::text[])
+                OR source ILIKE ANY($2::text[])
+            """, ['%test%', '%n8n%'], ['%test%'])
+        
+        deleted_count = _affected_rows(status)
+        news_cache.clear()
         
         logger.info(f"Cleaned up {deleted_count} test articles")
         return {"status": "success", "message": f"Cleaned up {deleted_count} test articles"}
@@ -1067,18 +1303,13 @@ async def clear_all_articles():
     try:
         logger.info("Clearing all news articles")
         
-        # Connect to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Delete all articles
-        cursor.execute("DELETE FROM chatbot.news_articles")
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            status = await conn.execute("DELETE FROM chatbot.news_articles")
         
-        deleted_count = cursor.rowcount
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
+        deleted_count = _affected_rows(status)
+        news_cache.clear()
         
         logger.info(f"Cleared {deleted_count} articles")
         return {"status": "success", "message": f"Cleared {deleted_count} articles"}
@@ -1094,4 +1325,15 @@ if __name__ == "__main__":
     print("🔧 API: http://localhost:8000")
     print("📚 API Docs: http://localhost:8000/docs")
     print("✨ Features: ChatGPT-like responses, semantic search, conversation context")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string. Each one opens its own DB pools
+    # (asyncpg plus the agent's), so stay at one unless WEB_CONCURRENCY is set
+    # to what the database's connection limit allows. uvicorn picks uvloop and
+    # httptools by itself where they're installed (not on Windows)
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    uvicorn.run(
+        "enhanced_chat_api:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        access_log=False
+    )
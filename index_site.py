@@ -5,8 +5,10 @@ Indexes Tableau sites by fetching metadata and storing in database
 
 import os
 import logging
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
+from pydantic import BaseModel, SecretStr, field_validator
 from src.tableau.enhanced_client import EnhancedTableauClient
 from src.database.store import upsert_records_batch, get_record_count, get_embedding_stats
 from src.tableau.quality_checks import QualityChecker, RateLimiter, PaginationHelper, validate_environment, get_indexing_recommendations
@@ -15,9 +17,67 @@ from src.tableau.quality_checks import QualityChecker, RateLimiter, PaginationHe
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class IndexerSettings(BaseModel):
+    """Indexer configuration, read and validated from the environment once at startup"""
+    server_url: str
+    pat_name: str
+    pat_secret: SecretStr
+    site_name: str
+    project_filter: Tuple[str, ...] = ()
+    
+    @field_validator('project_filter', mode='before')
+    @classmethod
+    def split_project_filter(cls, value):
+        """Accept TABLEAU_PROJECT_FILTER as a comma-separated string"""
+        if value is None:
+            return ()
+        if isinstance(value, str):
+            return tuple(p.strip() for p in value.split(",") if p.strip())
+        return value
+    
+    @classmethod
+    def from_env(cls) -> "IndexerSettings":
+        """Build settings from the TABLEAU_* environment variables"""
+        return cls(
+            server_url=os.getenv('TABLEAU_SERVER_URL'),
+            pat_name=os.getenv('TABLEAU_PAT_NAME'),
+            pat_secret=os.getenv('TABLEAU_PAT_SECRET'),
+            site_name=os.getenv('TABLEAU_SITE_NAME'),
+            project_filter=os.getenv('TABLEAU_PROJECT_FILTER')
+        )
+
+
+# Syncs larger than this are split into chunks upserted in parallel, each
+# worker on its own database connection
+PARALLEL_UPSERT_THRESHOLD = 500
+UPSERT_CHUNK_SIZE = 250
+UPSERT_WORKERS = 4
+
+
+def upsert_records_parallel(records: List[Dict[str, Any]], batch_size: int = 50) -> int:
+    """
+    Upsert records, spreading large syncs across worker threads
+    
+    Args:
+        records: List of record dictionaries to upsert
+        batch_size: Number of records per upsert transaction
+        
+    Returns:
+        Number of records processed
+    """
+    if len(records) <= PARALLEL_UPSERT_THRESHOLD:
+        return upsert_records_batch(records, batch_size=batch_size)
+    
+    chunks = [records[i:i + UPSERT_CHUNK_SIZE] for i in range(0, len(records), UPSERT_CHUNK_SIZE)]
+    logger.info(f"Upserting {len(chunks)} chunks across {UPSERT_WORKERS} workers")
+    
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as executor:
+        counts = executor.map(lambda chunk: upsert_records_batch(chunk, batch_size=batch_size), chunks)
+        return sum(counts)
+
 
 def index_site(server_url: str, pat_name: str, pat_secret: str, site_name: str, 
-               project_filter: str = None, object_types: list = None, 
+               project_filter: Optional[Tuple[str, ...]] = None, object_types: list = None, 
                enable_quality_checks: bool = True, max_objects: int = None) -> Dict[str, int]:
     """
     Index a Tableau site
@@ -27,7 +87,7 @@ def index_site(server_url: str, pat_name: str, pat_secret: str, site_name: str,
         pat_name: Personal Access Token name
         pat_secret: Personal Access Token secret
         site_name: Site name
-        project_filter: Optional comma-separated project names to filter
+        project_filter: Optional project names to filter
         object_types: List of object types to index (workbooks, datasources, views)
         enable_quality_checks: Whether to run quality checks on records
         max_objects: Optional maximum number of objects to index
@@ -122,7 +182,7 @@ def index_site(server_url: str, pat_name: str, pat_secret: str, site_name: str,
         # Upsert records to database
         logger.info(f"Upserting {len(records)} records to database...")
         try:
-            processed_count = upsert_records_batch(records, batch_size=50)
+            processed_count = upsert_records_parallel(records, batch_size=50)
             logger.info(f"Successfully processed {processed_count} records")
             
         except Exception as e:
@@ -172,24 +232,22 @@ def main():
         return
     
     # Get configuration
-    server_url = os.getenv('TABLEAU_SERVER_URL')
-    pat_name = os.getenv('TABLEAU_PAT_NAME')
-    pat_secret = os.getenv('TABLEAU_PAT_SECRET')
-    site_name = os.getenv('TABLEAU_SITE_NAME')
-    project_filter = os.getenv('TABLEAU_PROJECT_FILTER')
-    
-    # Parse project filter
-    project_list = None
-    if project_filter:
-        project_list = [p.strip() for p in project_filter.split(",") if p.strip()]
-        logger.info(f"Project filter: {project_list}")
+    settings = IndexerSettings.from_env()
+    if settings.project_filter:
+        logger.info(f"Project filter: {list(settings.project_filter)}")
     
     # Run indexing
     logger.info("Starting Tableau site indexing...")
-    logger.info(f"Server: {server_url}")
-    logger.info(f"Site: {site_name}")
+    logger.info(f"Server: {settings.server_url}")
+    logger.info(f"Site: {settings.site_name}")
     
-    stats = index_site(server_url, pat_name, pat_secret, site_name, project_filter)
+    stats = index_site(
+        settings.server_url,
+        settings.pat_name,
+        settings.pat_secret.get_secret_value(),
+        settings.site_name,
+        settings.project_filter or None
+    )
     
     # Print results
     print("\n" + "="*60)
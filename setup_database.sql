@@ -4,6 +4,9 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- Enable trigram matching (index support for ILIKE / regex on titles)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create chatbot schema
 CREATE SCHEMA IF NOT EXISTS chatbot;
 
@@ -31,10 +34,45 @@ CREATE INDEX IF NOT EXISTS idx_objects_site_type ON chatbot.objects(site_id, obj
 CREATE INDEX IF NOT EXISTS idx_objects_project ON chatbot.objects(project_name);
 CREATE INDEX IF NOT EXISTS idx_objects_owner ON chatbot.objects(owner);
 CREATE INDEX IF NOT EXISTS idx_objects_updated_at ON chatbot.objects(updated_at);
+CREATE INDEX IF NOT EXISTS idx_objects_object_id ON chatbot.objects(object_id);
+CREATE INDEX IF NOT EXISTS idx_objects_workbook_title ON chatbot.objects(title) WHERE object_type = 'workbook';
+-- Prefix matches (anchored regex / LIKE 'x%') on workbook titles, e.g. module numbers
+CREATE INDEX IF NOT EXISTS idx_objects_title_modnum ON chatbot.objects(title text_pattern_ops) WHERE object_type = 'workbook';
 
 -- Create GIN index for text search (optional, for BM25-like scoring)
 CREATE INDEX IF NOT EXISTS idx_objects_text_gin ON chatbot.objects USING gin(to_tsvector('english', text_blob));
 
+-- Trigram index on titles for substring and module-number regex matches
+CREATE INDEX IF NOT EXISTS idx_objects_title_trgm ON chatbot.objects USING gin(title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_objects_title_lower_trgm ON chatbot.objects USING gin(lower(title) gin_trgm_ops);
+
+-- Full-text index over all searchable columns (used by the chat API keyword search)
+CREATE INDEX IF NOT EXISTS idx_objects_fts_gin ON chatbot.objects USING gin(
+  to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' ||
+                         coalesce(project_name, '') || ' ' || coalesce(text_blob, ''))
+);
+
+-- Weighted full-text vector (title > description > text_blob) kept up to date by
+-- Postgres itself; used by the agent's module search
+ALTER TABLE chatbot.objects ADD COLUMN IF NOT EXISTS tsv tsvector GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+  setweight(to_tsvector('english', coalesce(text_blob, '')), 'C')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_objects_tsv_gin ON chatbot.objects USING gin(tsv);
+
+-- News indexes: latest-first pages for /news, and trigram indexes for the
+-- test-article cleanup (ILIKE '%test%'). The news_articles table is created by
+-- the n8n integration, so only index it if present
+DO $$
+BEGIN
+  IF to_regclass('chatbot.news_articles') IS NOT NULL THEN
+    CREATE INDEX IF NOT EXISTS idx_news_articles_published ON chatbot.news_articles(published_date DESC) WHERE is_active;
+    CREATE INDEX IF NOT EXISTS idx_news_articles_title_trgm ON chatbot.news_articles USING gin(title gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_news_articles_source_trgm ON chatbot.news_articles USING gin(source gin_trgm_ops);
+  END IF;
+END $$;
+
 -- Create vector similarity search index (HNSW for fast approximate nearest neighbor)
 CREATE INDEX IF NOT EXISTS idx_objects_embedding_hnsw ON chatbot.objects 
 USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
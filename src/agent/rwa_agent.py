@@ -2,17 +2,427 @@
 RWA Adele AI Agent - Intelligent reasoning and tool usage
 """
 import os
-import json
+import re
+import asyncio
+import hashlib
+import logging
+import threading
+import orjson
 import psycopg2
-from typing import List, Dict, Any, Optional
-from langchain.tools import Tool
+import psycopg2.errors
+import tiktoken
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from psycopg2.pool import ThreadedConnectionPool
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
 from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
+from src.api.cache import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Module numbers such as "13.20" or "2.30"
+_MODULE_NUM_RE = re.compile(r'(\d+\.\d+)')
+# A module number plus the rest of its title, up to a line end, "(" or "*".
+# The title is captured in a lookahead so numbers inside it are still found
+_MODULE_REF_RE = re.compile(r'(\d+\.\d+)(?=([^\n]*?)(?:\n|$|\(|\*))')
+# "### Header" markdown: the known section names are rewritten on their own,
+# anything else takes the rest of the line as the header
+_MARKDOWN_HEADER_RE = re.compile(
+    r'### (Purpose|Key Metrics|How to Use|Target Audience|Usage Notes|Features|Benefits)'
+    r'|###\s*([^#\n]+)'
+)
+
+# Query keyword sets, matched as substrings of the lowercased message
+_GREETINGS = frozenset({"hi", "hello", "hey", "good morning", "good afternoon", "good evening", "how are you", "how's it going"})
+_HELP_PHRASES = frozenset({"help", "what can you do", "what do you do", "how do you work", "assist"})
+_DETAIL_PHRASES = frozenset({"details", "tell me about", "explain", "what is", "describe"})
+_AMBIGUOUS_PHRASES = frozenset({"it", "this", "that", "the module"})
+_CONTEXT_PHRASES = frozenset({
+    "this module", "it", "that module", "what does this do", "tell me more about it",
+    "more details", "details", "key metrics", "what about", "tell me about",
+    "explain", "what are the", "what is the", "how about", "show me", "describe"
+})
+
+# Whole messages (lowercased, outer punctuation stripped) answered with a canned
+# reply instead of a ChatGPT call. Exact matches only: the substring checks
+# above also fire on "this" or "helpful", which must still reach the model
+_CANNED_GREETINGS = frozenset({
+    "hi", "hello", "hey", "hi there", "hello there", "hey there", "hi adele", "hello adele", "hey adele",
+    "good morning", "good afternoon", "good evening", "how are you", "how's it going"
+})
+_CANNED_HELP = frozenset({
+    "help", "help me", "can you help", "can you help me", "what can you do", "what do you do", "how do you work"
+})
+
+_GREETING_REPLY = (
+    "Hi, I'm Adele! I can help you find and understand RWA Pharmacy reports and modules. "
+    "Ask me about a module number like 13.20, a topic like NMS or stock, or a category such as financial or patient care."
+)
+_HELP_REPLY = (
+    "I can help you find your way around the RWA Pharmacy reports:\n\n"
+    "• **Look up a module** by number, e.g. \"tell me about 13.20\"\n"
+    "• **Search by topic**, e.g. \"NMS\", \"dead stock\" or \"care homes\"\n"
+    "• **Browse a category** such as financial, patient care, inventory or compliance\n"
+    "• **Ask follow-ups** like \"what are the key metrics?\" about the module we're discussing\n\n"
+    "What would you like to look at?"
+)
+
+# Categories detected in a query, checked in order (first match wins)
+_CATEGORY_KEYWORDS = {
+    "financial": frozenset({"financial", "sales", "margin", "revenue", "money"}),
+    "patient": frozenset({"patient", "care", "service", "clinical", "nms", "mur", "health"}),
+    "inventory": frozenset({"stock", "inventory", "product", "dispensing", "supply"}),
+    "compliance": frozenset({"compliance", "regulatory", "audit", "quality"}),
+    "nms": frozenset({"nms", "new medicine service", "medicine service"})
+}
+
+# Keywords searched for each category by _search_by_category
+_CATEGORY_SEARCH_KEYWORDS = {
+    "financial": ("financial", "sales", "margin", "revenue", "cost", "money"),
+    "patient": ("patient", "care", "service", "clinical", "nms", "mur", "health"),
+    "inventory": ("stock", "inventory", "product", "dispensing", "supply"),
+    "compliance": ("compliance", "regulatory", "audit", "quality", "standard"),
+    "staff": ("staff", "productivity", "performance", "management", "employee")
+}
+
+
+@lru_cache(maxsize=4096)
+def _clean_markdown_formatting(text: str) -> str:
+    """Clean markdown formatting to use proper formatting (### headers become **bold:**)
+    
+    Cached because the same module descriptions are formatted on every search.
+    """
+    if not text:
+        return text
+    return _MARKDOWN_HEADER_RE.sub(lambda m: f"**{m.group(1) or m.group(2)}:**", text)
+
+
+def _parse_description(description: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a rich JSON description; None for plain-text descriptions"""
+    # Only JSON objects are rich descriptions, so skip the parser for anything else
+    if not description or description.lstrip()[:1] != '{':
+        return None
+    try:
+        data = orjson.loads(description)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# Token budget for the conversation history sent with each message
+_HISTORY_TOKEN_BUDGET = 2000
+
+# History sent with each message: the exchanges holding the last 3 messages
+# verbatim, older exchanges as one short summary each
+_VERBATIM_MESSAGES = 3
+
+_SUMMARY_PROMPT = """Compress this exchange from a pharmacy-assistant dialogue into at most 40 tokens.
+Keep every module number (like 13.20) and module title mentioned, and what the user wanted to know about them.
+Write plain sentences with no preamble."""
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional["tiktoken.Encoding"]:
+    """Tokenizer for the chat model (cl100k_base on tiktoken versions predating it)
+    
+    tiktoken downloads the encoding file the first time it's loaded; on a host
+    that can't reach it this returns None (once, the result is cached) and
+    token counts fall back to an estimate, see _count_tokens.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model("gpt-4o-mini")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load the tiktoken encoding, estimating token counts instead: {e}")
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """Tokens in text, or roughly a quarter of its length without a tokenizer"""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def _trim_to_token_budget(history: List[Dict[str, str]], budget: int = _HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """Most recent messages whose contents fit within budget tokens, oldest dropped first"""
+    total = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        total += _count_tokens(history[i].get("content") or "")
+        if total > budget:
+            break
+        start = i
+    return history[start:]
+
+
+def _recent_module_refs(conversation_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Modules mentioned in the last 6 messages' assistant replies, in one pass
+    
+    Each number appears once as {"number", "title"}; a number mentioned again
+    moves to the end, so the last entry is always the latest mention.
+    """
+    refs: Dict[str, str] = {}
+    for msg in conversation_history[-6:]:
+        if msg.get("role") != "assistant":
+            continue
+        seen = set()
+        for match in _MODULE_REF_RE.finditer(msg.get("content", "")):
+            number = match.group(1)
+            if number in seen:
+                # Keep the title from this reply's first mention
+                refs[number] = refs.pop(number)
+            else:
+                seen.add(number)
+                refs.pop(number, None)
+                refs[number] = (number + match.group(2)).strip()
+    return [{"number": number, "title": title} for number, title in refs.items()]
+
+
+def _history_key(messages: List[Dict[str, str]]) -> str:
+    """Cache key for a run of messages"""
+    return hashlib.sha1(orjson.dumps([[m.get("role"), m.get("content")] for m in messages])).hexdigest()
+
+
+def _exchanges(history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Split history into exchanges, each a user message and the replies to it"""
+    exchanges = []
+    for msg in history:
+        if msg.get("role") == "user" or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append(msg)
+    return exchanges
+
+
+def _trie_pattern(words) -> str:
+    """Regex alternation for words, factored into a prefix trie and longest-first"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Optional (greedy) when a word ends here, so the longer word is tried first
+        return f"(?:{body})?" if "" in node else body
+    
+    return build(trie)
+
+
+def _build_keyword_matcher(groups):
+    """Compile keyword groups into one regex that scans a query in a single pass
+    
+    The pattern sits in a lookahead so every position is tried, which keeps the
+    overlapping substring semantics of `keyword in text`. Only the longest keyword
+    is captured at each position, so each keyword also carries the tags of every
+    keyword that is a prefix of it (e.g. "what is the" implies "what is").
+    """
+    tags_by_keyword: Dict[str, set] = {}
+    for tag, keywords in groups:
+        for keyword in keywords:
+            tags_by_keyword.setdefault(keyword, set()).add(tag)
+    
+    keyword_tags = {
+        keyword: frozenset().union(*(tags for other, tags in tags_by_keyword.items() if keyword.startswith(other)))
+        for keyword in tags_by_keyword
+    }
+    return re.compile(f"(?=({_trie_pattern(keyword_tags)}))"), keyword_tags
+
+
+_KEYWORD_RE, _KEYWORD_TAGS = _build_keyword_matcher([
+    ("greeting", _GREETINGS),
+    ("help", _HELP_PHRASES),
+    ("detail", _DETAIL_PHRASES),
+    ("ambiguous", _AMBIGUOUS_PHRASES),
+    ("context", _CONTEXT_PHRASES),
+    *((("category", category), keywords) for category, keywords in _CATEGORY_KEYWORDS.items())
+])
+
+
+def _keyword_tags(text: str) -> set:
+    """Tags of every keyword group with a keyword occurring in text (already lowercased)"""
+    hits = set()
+    for keyword in _KEYWORD_RE.findall(text):
+        hits |= _KEYWORD_TAGS[keyword]
+    return hits
+
+
+# The agent's hot queries, as (parameter types, query). Each is prepared on a
+# pooled connection the first time it's used there, so Postgres skips parse and
+# plan on later tool calls (see _execute_statement)
+#   search_modules_stmt: full-text search on the weighted, GIN-indexed tsv column.
+#       text_blob is only matched through tsv, never fetched: it's the widest
+#       column. Normalization 32 scales ts_rank_cd into 0-1 for display
+#   search_tsquery_stmt: the same search for a ready-made tsquery (e.g. the
+#       OR-joined keywords of a category)
+#   module_number_stmt: fast path for a bare module number; an anchored regex
+#       (e.g. ^13\.20\y) has a fixed prefix, so idx_objects_title_modnum serves it
+#   module_details_stmt: module by number or title. Both the substring LIKE and
+#       the trigram % operator are served by idx_objects_title_lower_trgm; titles
+#       starting with the identifier still rank first
+_STATEMENTS = {
+    "search_modules_stmt": ("(text)", """
+        SELECT object_type, title, description, project_name, url,
+               ts_rank_cd(tsv, q, 32) AS similarity_score
+        FROM chatbot.objects, plainto_tsquery('english', $1) q
+        WHERE object_type = 'workbook' AND tsv @@ q
+        ORDER BY similarity_score DESC, title
+        LIMIT 10
+    """),
+    "search_tsquery_stmt": ("(text)", """
+        SELECT object_type, title, description, project_name, url,
+               ts_rank_cd(tsv, q, 32) AS similarity_score
+        FROM chatbot.objects, to_tsquery('english', $1) q
+        WHERE object_type = 'workbook' AND tsv @@ q
+        ORDER BY similarity_score DESC, title
+        LIMIT 10
+    """),
+    "module_number_stmt": ("(text)", """
+        SELECT object_type, title, description, project_name, url
+        FROM chatbot.objects
+        WHERE object_type = 'workbook' AND title ~ $1
+        ORDER BY title
+        LIMIT 1
+    """),
+    "module_details_stmt": ("(text)", """
+        SELECT object_type, title, description, project_name, url
+        FROM chatbot.objects
+        WHERE object_type = 'workbook'
+        AND (lower(title) LIKE '%' || lower($1) || '%' OR lower(title) % lower($1))
+        ORDER BY
+            lower(title) LIKE lower($1) || '%' DESC,
+            similarity(lower(title), lower($1)) DESC,
+            title
+        LIMIT 1
+    """),
+    "list_modules_stmt": ("", """
+        SELECT title, project_name, description, url
+        FROM chatbot.objects
+        WHERE object_type = 'workbook'
+        ORDER BY project_name, title
+    """),
+    "list_project_modules_stmt": ("(text)", """
+        SELECT title, project_name, description, url
+        FROM chatbot.objects
+        WHERE object_type = 'workbook' AND project_name ILIKE '%' || $1 || '%'
+        ORDER BY project_name, title
+    """),
+    "module_links_stmt": ("", """
+        SELECT title, url
+        FROM chatbot.objects
+        WHERE object_type = 'workbook' AND url IS NOT NULL AND url != ''
+        ORDER BY LENGTH(title) DESC
+    """),
+}
+
+
+class _AgentConnection(psycopg2.extensions.connection):
+    """Pooled connection that remembers which agent statements it has prepared"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        # Statements that couldn't be prepared or executed as prepared here
+        self.unprepared = set()
+
+
+def _execute_statement(conn: _AgentConnection, cursor, name: str, params: tuple = ()):
+    """Run one of _STATEMENTS, preparing it on this connection on first use
+    
+    If the statement can't be prepared (say it needs a column or extension
+    that isn't deployed yet) or its prepared form has gone missing (pgbouncer
+    in transaction mode), it runs as a plain query instead, from then on for
+    this connection, so only the tools using it are affected.
+    """
+    arg_types, query = _STATEMENTS[name]
+    if name not in conn.unprepared:
+        try:
+            if name not in conn.prepared:
+                cursor.execute(f"PREPARE {name} {arg_types} AS {query}")
+                conn.prepared.add(name)
+            if params:
+                cursor.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+            else:
+                cursor.execute(f"EXECUTE {name}")
+            return
+        except psycopg2.Error as e:
+            # Errors from running the query itself are the caller's to handle
+            if name in conn.prepared and not isinstance(e, psycopg2.errors.InvalidSqlStatementName):
+                raise
+            logger.warning(f"Running {name} unprepared: {e}")
+            conn.rollback()
+            conn.unprepared.add(name)
+    
+    if params:
+        # $n placeholders become psycopg2 %(n)s ones; literal % signs are escaped
+        plain_query = re.sub(r"\$(\d+)", r"%(\1)s", query.replace("%", "%%"))
+        cursor.execute(plain_query, {str(i): value for i, value in enumerate(params, 1)})
+    else:
+        cursor.execute(query)
+
+
+# Shared by every agent instance; created on first use so importing the module
+# doesn't need a database
+_POOL_MAX_CONNECTIONS = 16
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# ThreadedConnectionPool raises PoolError when it runs out rather than waiting,
+# and the agent is called from more threads than it has connections (to_thread
+# callers plus _details_executor), so callers queue here for a free one
+_pool_slots = threading.BoundedSemaphore(_POOL_MAX_CONNECTIONS)
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    minconn=2,
+                    maxconn=_POOL_MAX_CONNECTIONS,
+                    dsn=os.getenv('DATABASE_URL'),
+                    connection_factory=_AgentConnection,
+                    # Bound slow queries so a tool call can't stall a chat turn
+                    options="-c statement_timeout=3000"
+                )
+    return _pool
+
+
+# Runs module detail lookups side by side when a message names several modules
+_details_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rwa-agent-details")
+
+
+def _cached_tool(method):
+    """Cache a read-only tool's formatted response, keyed on its normalized argument
+    
+    Error responses aren't cached so a database hiccup isn't remembered.
+    """
+    @wraps(method)
+    def wrapper(self, arg: Optional[str] = None) -> str:
+        key = (method.__name__, arg.strip().lower() if arg else None)
+        response = self._tool_cache.get(key)
+        if response is None:
+            response = method(self, arg)
+            if not response.startswith("Error "):
+                self._tool_cache.set(key, response)
+        return response
+    return wrapper
+
+
 class RWAAgent:
     """Intelligent AI agent for RWA pharmacy chatbot"""
     
@@ -22,211 +432,132 @@ class RWAAgent:
             temperature=0.1,
             api_key=os.getenv('OPENAI_API_KEY')
         )
-        self.memory = ConversationBufferWindowMemory(
-            k=10,
-            memory_key="chat_history",
-            return_messages=True
+        # Formatted tool responses; chatbot.objects changes rarely
+        self._tool_cache = TTLCache(maxsize=1024, ttl=300, threadsafe=True)
+        # Compresses older conversation history (see _summarize_history)
+        self.summary_llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            max_tokens=160,
+            api_key=os.getenv('OPENAI_API_KEY')
         )
-        self.tools = self._create_tools()
-    
-    def _get_db_connection(self):
-        """Get database connection"""
-        return psycopg2.connect(os.getenv('DATABASE_URL'))
-    
-    def _create_tools(self) -> List[Tool]:
-        """Create tools for the agent to use"""
-        return [
-            Tool(
-                name="search_modules",
-                description="Search for pharmacy modules by keywords, module numbers, or descriptions. Use this for general searches.",
-                func=self._search_modules
-            ),
-            Tool(
-                name="get_module_details",
-                description="Get detailed information about a specific module by its exact title or module number (e.g., '13.20', '2.30'). Use this when user asks for details about a specific module.",
-                func=self._get_module_details
-            ),
-            Tool(
-                name="search_by_category",
-                description="Search for modules by category (financial, patient care, inventory, compliance, etc.). Use this when user mentions broad categories.",
-                func=self._search_by_category
-            ),
-            Tool(
-                name="find_similar_modules",
-                description="Find modules similar to a given module. Use this when user asks for 'similar' or 'related' modules.",
-                func=self._find_similar_modules
-            ),
-            Tool(
-                name="list_all_modules",
-                description="List all available modules in a specific project or category. Use this when user asks to 'show all' or 'list' modules.",
-                func=self._list_all_modules
-            )
-        ]
+        # Summaries of single exchanges, keyed on the exchange's messages
+        self._summary_cache = TTLCache(maxsize=4096, ttl=3600, threadsafe=True)
+        # Load (and if need be download) the tokenizer now rather than on the
+        # first chat with history
+        _encoding()
+    
+    @contextmanager
+    def _conn(self):
+        """Borrow a connection from the shared pool, waiting if all are in use
+        
+        Run the agent statements on it with _execute_statement.
+        """
+        pool = _get_pool()
+        _pool_slots.acquire()
+        try:
+            conn = pool.getconn()
+        except Exception:
+            _pool_slots.release()
+            raise
+        try:
+            yield conn
+        finally:
+            # The tools only read, so end the implicit transaction and hand the
+            # connection back clean; drop it if the server side has gone away
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            try:
+                pool.putconn(conn, close=broken)
+            finally:
+                _pool_slots.release()
     
     def _analyze_query(self, query: str) -> Dict[str, Any]:
-        """Analyze the query to determine the best approach"""
-        query_lower = query.lower().strip()
+        """Analyze the query to determine the best approach
         
-        # Check for greetings and casual conversation
-        greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening", "how are you", "how's it going"]
-        is_greeting = any(greeting in query_lower for greeting in greetings) or query_lower in ["hi", "hello", "hey"]
+        Computed once per message and passed along to _should_search_database
+        and _get_search_results, so the message is lowered and scanned only once.
+        """
+        query_lower = query.lower().strip()
         
-        # Check for help requests
-        help_phrases = ["help", "what can you do", "what do you do", "how do you work", "assist"]
-        is_help_request = any(phrase in query_lower for phrase in help_phrases)
+        # Every keyword group (greetings, help, details, categories...) in one scan
+        hits = _keyword_tags(query_lower)
         
         # Check for specific module numbers (e.g., "13.20", "2.30")
-        import re
-        module_numbers = re.findall(r'(\d+\.\d+)', query)
-        
-        # Check for detail requests
-        detail_phrases = ["details", "tell me about", "explain", "what is", "describe"]
-        asking_for_details = any(phrase in query_lower for phrase in detail_phrases)
+        module_numbers = _MODULE_NUM_RE.findall(query)
         
         # Check for category searches
-        categories = {
-            "financial": ["financial", "sales", "margin", "revenue", "money"],
-            "patient": ["patient", "care", "service", "clinical", "nms", "mur", "health"],
-            "inventory": ["stock", "inventory", "product", "dispensing", "supply"],
-            "compliance": ["compliance", "regulatory", "audit", "quality"],
-            "nms": ["nms", "new medicine service", "medicine service"]
-        }
-        
-        detected_category = None
-        for category, keywords in categories.items():
-            if any(keyword in query_lower for keyword in keywords):
-                detected_category = category
-                break
+        detected_category = next(
+            (category for category in _CATEGORY_KEYWORDS if ("category", category) in hits), None
+        )
         
         return {
-            "is_greeting": is_greeting,
-            "is_help_request": is_help_request,
+            "is_greeting": "greeting" in hits,
+            "is_help_request": "help" in hits,
             "module_numbers": module_numbers,
-            "asking_for_details": asking_for_details,
+            "asking_for_details": "detail" in hits,
             "category": detected_category,
-            "is_ambiguous": any(phrase in query_lower for phrase in ["it", "this", "that", "the module"])
+            "is_ambiguous": "ambiguous" in hits,
+            "is_context_query": "context" in hits,
+            "mentions_nms": "nms" in query_lower
         }
     
+    @_cached_tool
     def _search_modules(self, query: str) -> str:
         """Search for modules using semantic search"""
         try:
-            conn = self._get_db_connection()
-            cursor = conn.cursor()
-            
-            # Enhanced search query with better pattern matching
-            search_query = """
-            SELECT 
-                object_type,
-                title,
-                description,
-                project_name,
-                url,
-                text_blob,
-                similarity_score
-            FROM (
-                SELECT 
-                    object_type,
-                    title,
-                    description,
-                    project_name,
-                    url,
-                    text_blob,
-                    CASE 
-                        WHEN title ILIKE %s THEN 1.0
-                        WHEN title ILIKE %s THEN 0.9
-                        WHEN title ILIKE %s THEN 0.8
-                        WHEN text_blob ILIKE %s THEN 0.7
-                        WHEN description ILIKE %s THEN 0.6
-                        ELSE 0.5
-                    END as similarity_score
-                FROM chatbot.objects 
-                WHERE object_type = 'workbook'
-            ) ranked
-            WHERE similarity_score > 0.5
-            ORDER BY similarity_score DESC, title
-            LIMIT 10
-            """
-            
-            query_lower = query.lower()
-            
-            # Create multiple search patterns for better matching
-            patterns = [
-                f"%{query_lower}%",  # Contains in title
-                f"{query_lower}%",   # Starts with query
-                f"% {query_lower} %", # Word boundary match
-                f"%{query_lower}%",  # Contains in text_blob
-                f"%{query_lower}%"   # Contains in description
-            ]
+            with self._conn() as conn, conn.cursor() as cursor:
+                _execute_statement(conn, cursor, "search_modules_stmt", (query,))
+                results = cursor.fetchall()
             
-            cursor.execute(search_query, patterns)
-            results = cursor.fetchall()
+            return self._format_search_results(query, results)
             
-            if not results:
-                # Try a broader search with the first word only
-                words = query_lower.split()
-                if words:
-                    first_word = words[0]
-                    word_patterns = [
-                        f"%{first_word}%",
-                        f"{first_word}%",
-                        f"% {first_word} %",
-                        f"%{first_word}%",
-                        f"%{first_word}%"
-                    ]
-                    
-                    cursor.execute(search_query, word_patterns)
-                    results = cursor.fetchall()
-            
-            if not results:
-                return f"No modules found matching '{query}'"
-            
-            response = f"Found {len(results)} module(s) matching '{query}':\n\n"
-            for i, (obj_type, title, desc, project, url, text_blob, score) in enumerate(results, 1):
-                # Format title as clickable link if URL exists
-                if url:
-                    response += f"{i}. **[{title}]({url})** ({project})\n"
-                else:
-                    response += f"{i}. **{title}** ({project})\n"
-                if desc and len(desc) > 50:
-                    # Try to parse JSON description
-                    try:
-                        desc_data = json.loads(desc)
-                        if isinstance(desc_data, dict) and desc_data.get('detailed_description'):
-                            # Clean the markdown formatting
-                            cleaned_desc = self._clean_markdown_formatting(desc_data['detailed_description'])
-                            response += f"   {cleaned_desc[:100]}...\n"
-                    except:
-                        # Clean the description if it's a string
-                        cleaned_desc = self._clean_markdown_formatting(desc)
-                        response += f"   {cleaned_desc[:100]}...\n"
-                response += f"   Relevance: {score:.1%}\n\n"
+        except Exception as e:
+            return f"Error searching modules: {str(e)}"
+    
+    @_cached_tool
+    def _search_tsq(self, tsquery: str) -> str:
+        """Search for modules matching a tsquery, e.g. 'financial | sales | margin'"""
+        try:
+            with self._conn() as conn, conn.cursor() as cursor:
+                _execute_statement(conn, cursor, "search_tsquery_stmt", (tsquery,))
+                results = cursor.fetchall()
             
-            cursor.close()
-            conn.close()
-            return response
+            return self._format_search_results(tsquery, results)
             
         except Exception as e:
             return f"Error searching modules: {str(e)}"
     
-    def _clean_markdown_formatting(self, text: str) -> str:
-        """Clean markdown formatting to use proper formatting"""
-        if not text:
-            return text
-        
-        # Replace ### headers with **bold** formatting
-        text = text.replace('### Purpose', '**Purpose:**')
-        text = text.replace('### Key Metrics', '**Key Metrics:**')
-        text = text.replace('### How to Use', '**How to Use:**')
-        text = text.replace('### Target Audience', '**Target Audience:**')
-        text = text.replace('### Usage Notes', '**Usage Notes:**')
-        text = text.replace('### Features', '**Features:**')
-        text = text.replace('### Benefits', '**Benefits:**')
+    def _format_search_results(self, query: str, results: List[tuple]) -> str:
+        """Format search result rows as a numbered module list"""
+        if not results:
+            return f"No modules found matching '{query}'"
         
-        # Replace any remaining ### with **
-        import re
-        text = re.sub(r'###\s*([^#\n]+)', r'**\1:**', text)
+        parts = [f"Found {len(results)} module(s) matching '{query}':\n\n"]
+        for i, (obj_type, title, desc, project, url, score) in enumerate(results, 1):
+            # Format title as clickable link if URL exists
+            if url:
+                parts.append(f"{i}. **[{title}]({url})** ({project})\n")
+            else:
+                parts.append(f"{i}. **{title}** ({project})\n")
+            if desc and len(desc) > 50:
+                # Try to parse JSON description
+                desc_data = _parse_description(desc)
+                if desc_data is None:
+                    # Clean the description if it's a string
+                    cleaned_desc = _clean_markdown_formatting(desc)
+                    parts.append(f"   {cleaned_desc[:100]}...\n")
+                elif desc_data.get('detailed_description'):
+                    # Clean the markdown formatting
+                    cleaned_desc = _clean_markdown_formatting(desc_data['detailed_description'])
+                    parts.append(f"   {cleaned_desc[:100]}...\n")
+            parts.append(f"   Relevance: {score:.1%}\n\n")
         
-        return text
+        return "".join(parts)
     
     def _add_module_links(self, text: str) -> str:
         """Add clickable links to module names mentioned in text"""
@@ -234,29 +565,14 @@ class RWAAgent:
             return text
         
         try:
-            import re
-            import logging
-            
-            logger = logging.getLogger(__name__)
             logger.info(f"_add_module_links called with text length: {len(text)}")
             
-            conn = self._get_db_connection()
-            cursor = conn.cursor()
-            
             # Get all modules with their URLs
-            cursor.execute("""
-                SELECT title, url
-                FROM chatbot.objects 
-                WHERE object_type = 'workbook' AND url IS NOT NULL AND url != ''
-                ORDER BY LENGTH(title) DESC
-            """)
-            
-            modules = cursor.fetchall()
+            with self._conn() as conn, conn.cursor() as cursor:
+                _execute_statement(conn, cursor, "module_links_stmt")
+                modules = cursor.fetchall()
             logger.info(f"Found {len(modules)} modules with URLs")
             
-            cursor.close()
-            conn.close()
-            
             # Use simpler, more reliable pattern
             for title, url in modules:
                 if title and url:
@@ -278,190 +594,236 @@ class RWAAgent:
             
         except Exception as e:
             # If link addition fails, just return original text
-            import logging
-            logging.error(f"Error adding module links: {e}")
+            logger.error(f"Error adding module links: {e}")
             return text
 
+    @_cached_tool
     def _get_module_details(self, module_identifier: str) -> str:
         """Get detailed information about a specific module"""
         try:
-            conn = self._get_db_connection()
-            cursor = conn.cursor()
-            
             # Search for module by number or title
-            search_query = """
-            SELECT 
-                object_type,
-                title,
-                description,
-                project_name,
-                url,
-                text_blob
-            FROM chatbot.objects 
-            WHERE object_type = 'workbook' 
-            AND (title ILIKE %s OR title ILIKE %s)
-            ORDER BY 
-                CASE WHEN title ILIKE %s THEN 1 ELSE 2 END,
-                title
-            LIMIT 1
-            """
-            
-            patterns = [
-                f"%{module_identifier}%",
-                f"{module_identifier}%",
-                f"{module_identifier}%"
-            ]
-            
-            cursor.execute(search_query, patterns)
-            result = cursor.fetchone()
+            with self._conn() as conn, conn.cursor() as cursor:
+                result = None
+                module_number = module_identifier.strip()
+                if _MODULE_NUM_RE.fullmatch(module_number):
+                    # Titles that start with the number (\y is Postgres' word boundary)
+                    _execute_statement(conn, cursor, "module_number_stmt", (rf'^{re.escape(module_number)}\y',))
+                    result = cursor.fetchone()
+                if not result:
+                    # Numbers can also sit mid-title (e.g. "Performance Management _13.05 ...")
+                    _execute_statement(conn, cursor, "module_details_stmt", (module_identifier,))
+                    result = cursor.fetchone()
             
             if not result:
                 return f"Module '{module_identifier}' not found. Try searching for it first."
             
-            obj_type, title, description, project_name, url, text_blob = result
+            obj_type, title, description, project_name, url = result
             
             # Format title as clickable link if URL exists
             if url:
-                response = f"**[{title}]({url})**\n"
+                parts = [f"**[{title}]({url})**\n"]
             else:
-                response = f"**{title}**\n"
-            response += f"*({project_name})*\n\n"
+                parts = [f"**{title}**\n"]
+            parts.append(f"*({project_name})*\n\n")
             
             # Try to parse rich description
             if description:
-                try:
-                    desc_data = json.loads(description)
-                    if isinstance(desc_data, dict):
-                        if desc_data.get('detailed_description'):
-                            # Clean the markdown formatting
-                            cleaned_desc = self._clean_markdown_formatting(desc_data['detailed_description'])
-                            response += f"{cleaned_desc}\n\n"
-                        
-                        if desc_data.get('purpose'):
-                            response += f"**Purpose:**\n{desc_data['purpose']}\n\n"
-                        
-                        if desc_data.get('key_metrics'):
-                            metrics = desc_data['key_metrics']
-                            if isinstance(metrics, list):
-                                response += "**Key Metrics:**\n"
-                                for metric in metrics:
-                                    response += f"• {metric}\n"
-                                response += "\n"
-                        
-                        if desc_data.get('usage_notes'):
-                            response += f"**How to Use:**\n{desc_data['usage_notes']}\n\n"
-                        
-                        if desc_data.get('target_audience'):
-                            response += f"**Target Audience:**\n{desc_data['target_audience']}\n\n"
-                    else:
-                        # Clean the description if it's a string
-                        cleaned_desc = self._clean_markdown_formatting(description)
-                        response += f"{cleaned_desc}\n\n"
-                except:
-                    response += f"{description}\n\n"
+                desc_data = _parse_description(description)
+                if desc_data is not None:
+                    if desc_data.get('detailed_description'):
+                        # Clean the markdown formatting
+                        cleaned_desc = _clean_markdown_formatting(desc_data['detailed_description'])
+                        parts.append(f"{cleaned_desc}\n\n")
+                    
+                    if desc_data.get('purpose'):
+                        parts.append(f"**Purpose:**\n{desc_data['purpose']}\n\n")
+                    
+                    if desc_data.get('key_metrics'):
+                        metrics = desc_data['key_metrics']
+                        if isinstance(metrics, list):
+                            parts.append("**Key Metrics:**\n")
+                            for metric in metrics:
+                                parts.append(f"• {metric}\n")
+                            parts.append("\n")
+                    
+                    if desc_data.get('usage_notes'):
+                        parts.append(f"**How to Use:**\n{desc_data['usage_notes']}\n\n")
+                    
+                    if desc_data.get('target_audience'):
+                        parts.append(f"**Target Audience:**\n{desc_data['target_audience']}\n\n")
+                else:
+                    parts.append(f"{description}\n\n")
             else:
                 # Generate intelligent fallback based on title
                 title_lower = title.lower()
                 if any(word in title_lower for word in ["financial", "sales", "margin"]):
-                    response += "This module focuses on financial performance and reporting. It tracks financial metrics, sales data, margins, and revenue analysis to help optimize pharmacy operations.\n\n"
+                    parts.append("This module focuses on financial performance and reporting. It tracks financial metrics, sales data, margins, and revenue analysis to help optimize pharmacy operations.\n\n")
                 elif any(word in title_lower for word in ["patient", "care", "service", "clinical", "nms", "mur"]):
-                    response += "This module focuses on patient care and clinical services. It monitors patient care delivery, clinical services, and health outcomes to ensure quality care.\n\n"
+                    parts.append("This module focuses on patient care and clinical services. It monitors patient care delivery, clinical services, and health outcomes to ensure quality care.\n\n")
                 elif any(word in title_lower for word in ["stock", "inventory", "product"]):
-                    response += "This module focuses on inventory and product management. It manages stock levels, product performance, and dispensing operations.\n\n"
+                    parts.append("This module focuses on inventory and product management. It manages stock levels, product performance, and dispensing operations.\n\n")
                 else:
-                    response += "This module provides insights into pharmacy operations and performance to help optimize decision-making.\n\n"
+                    parts.append("This module provides insights into pharmacy operations and performance to help optimize decision-making.\n\n")
             
-            cursor.close()
-            conn.close()
-            return response
+            return "".join(parts)
             
         except Exception as e:
             return f"Error getting module details: {str(e)}"
     
     def _search_by_category(self, category: str) -> str:
         """Search modules by category"""
-        category_keywords = {
-            "financial": ["financial", "sales", "margin", "revenue", "cost", "money"],
-            "patient": ["patient", "care", "service", "clinical", "nms", "mur", "health"],
-            "inventory": ["stock", "inventory", "product", "dispensing", "supply"],
-            "compliance": ["compliance", "regulatory", "audit", "quality", "standard"],
-            "staff": ["staff", "productivity", "performance", "management", "employee"]
-        }
-        
-        keywords = category_keywords.get(category.lower(), [category])
-        query = " OR ".join(keywords)
-        return self._search_modules(query)
+        keywords = _CATEGORY_SEARCH_KEYWORDS.get(category.lower())
+        if not keywords:
+            # Not a known category: search for it as typed
+            return self._search_modules(category)
+        # Any keyword matches: one indexed query on an OR-joined tsquery
+        return self._search_tsq(" | ".join(keywords))
     
     def _find_similar_modules(self, module_title: str) -> str:
         """Find modules similar to the given one"""
         return self._search_modules(module_title)
     
+    @_cached_tool
     def _list_all_modules(self, project: str = None) -> str:
         """List all modules, optionally filtered by project"""
         try:
-            conn = self._get_db_connection()
-            cursor = conn.cursor()
-            
-            if project:
-                query = """
-                SELECT title, project_name, description, url
-                FROM chatbot.objects 
-                WHERE object_type = 'workbook' AND project_name ILIKE %s
-                ORDER BY project_name, title
-                """
-                cursor.execute(query, [f"%{project}%"])
-            else:
-                query = """
-                SELECT title, project_name, description, url
-                FROM chatbot.objects 
-                WHERE object_type = 'workbook'
-                ORDER BY project_name, title
-                """
-                cursor.execute(query)
-            
-            results = cursor.fetchall()
+            with self._conn() as conn, conn.cursor() as cursor:
+                if project:
+                    _execute_statement(conn, cursor, "list_project_modules_stmt", (project,))
+                else:
+                    _execute_statement(conn, cursor, "list_modules_stmt")
+                results = cursor.fetchall()
             
             if not results:
                 return f"No modules found for project '{project}'" if project else "No modules found"
             
-            response = f"Found {len(results)} module(s):\n\n"
+            parts = [f"Found {len(results)} module(s):\n\n"]
             current_project = None
             
             for title, proj_name, desc, url in results:
                 if proj_name != current_project:
-                    response += f"**{proj_name}**\n"
+                    parts.append(f"**{proj_name}**\n")
                     current_project = proj_name
                 
                 # Format as clickable link if URL exists
                 if url:
-                    response += f"• [{title}]({url})\n"
+                    parts.append(f"• [{title}]({url})\n")
                 else:
-                    response += f"• {title}\n"
+                    parts.append(f"• {title}\n")
                 if desc and len(desc) > 50:
-                    try:
-                        desc_data = json.loads(desc)
-                        if isinstance(desc_data, dict) and desc_data.get('detailed_description'):
-                            # Clean the markdown formatting
-                            cleaned_desc = self._clean_markdown_formatting(desc_data['detailed_description'])
-                            response += f"  {cleaned_desc[:80]}...\n"
-                    except:
+                    desc_data = _parse_description(desc)
+                    if desc_data is None:
                         # Clean the description if it's a string
-                        cleaned_desc = self._clean_markdown_formatting(desc)
-                        response += f"  {cleaned_desc[:80]}...\n"
-                response += "\n"
+                        cleaned_desc = _clean_markdown_formatting(desc)
+                        parts.append(f"  {cleaned_desc[:80]}...\n")
+                    elif desc_data.get('detailed_description'):
+                        # Clean the markdown formatting
+                        cleaned_desc = _clean_markdown_formatting(desc_data['detailed_description'])
+                        parts.append(f"  {cleaned_desc[:80]}...\n")
+                parts.append("\n")
             
-            cursor.close()
-            conn.close()
-            return response
+            return "".join(parts)
             
         except Exception as e:
             return f"Error listing modules: {str(e)}"
     
     def chat(self, message: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
         """Main chat interface using ChatGPT with tool access and database grounding"""
+        canned = self._canned_response(message, conversation_history)
+        if canned:
+            return canned
+        
+        try:
+            messages = self._build_messages(message, conversation_history)
+            
+            # Get response from ChatGPT
+            response = self.llm.invoke(messages)
+            
+            return self._finish_response(response.content, message, conversation_history)
+            
+        except Exception as e:
+            return self._error_response(e, conversation_history)
+    
+    async def achat(self, message: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Async chat(): the ChatGPT call is awaited rather than holding a thread
+        
+        Database grounding and module links still use the pooled psycopg2
+        connections, so those steps run in worker threads.
+        """
+        canned = self._canned_response(message, conversation_history)
+        if canned:
+            return canned
+        
+        try:
+            messages = await asyncio.to_thread(self._build_messages, message, conversation_history)
+            
+            # Get response from ChatGPT
+            response = await self.llm.ainvoke(messages)
+            
+            return await asyncio.to_thread(self._finish_response, response.content, message, conversation_history)
+            
+        except Exception as e:
+            return self._error_response(e, conversation_history)
+    
+    def chat_stream(self, message: str, conversation_history: List[Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream a chat reply as {"delta": text} events followed by a final {"done": True, ...} event
+        
+        Deltas are the raw model output; the final event carries the cleaned,
+        linked response and updated history exactly as chat() returns them.
+        """
+        canned = self._canned_response(message, conversation_history)
+        if canned:
+            yield {"delta": canned["response"]}
+            yield {"done": True, **canned}
+            return
+        
         try:
-            # Build context for ChatGPT
-            system_prompt = """You are RWA Adele, an intelligent assistant for RWA Pharmacy that helps users find and understand pharmacy reports and modules.
+            messages = self._build_messages(message, conversation_history)
+            
+            chunks = []
+            for chunk in self.llm.stream(messages):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield {"delta": chunk.content}
+            
+            result = self._finish_response("".join(chunks), message, conversation_history)
+            
+        except Exception as e:
+            result = self._error_response(e, conversation_history)
+        
+        yield {"done": True, **result}
+    
+    async def achat_stream(self, message: str, conversation_history: List[Dict[str, str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async chat_stream(): tokens are awaited as they arrive rather than pulled from a thread
+        
+        Yields the same events as chat_stream(); the database steps run in worker threads.
+        """
+        canned = self._canned_response(message, conversation_history)
+        if canned:
+            yield {"delta": canned["response"]}
+            yield {"done": True, **canned}
+            return
+        
+        try:
+            messages = await asyncio.to_thread(self._build_messages, message, conversation_history)
+            
+            chunks = []
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield {"delta": chunk.content}
+            
+            result = await asyncio.to_thread(self._finish_response, "".join(chunks), message, conversation_history)
+            
+        except Exception as e:
+            result = self._error_response(e, conversation_history)
+        
+        yield {"done": True, **result}
+    
+    def _build_messages(self, message: str, conversation_history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """Build the ChatGPT prompt for a message, grounded in database search results"""
+        # Build context for ChatGPT
+        system_prompt = """You are RWA Adele, an intelligent assistant for RWA Pharmacy that helps users find and understand pharmacy reports and modules.
 
 You have access to a database of pharmacy modules and can:
 - Search for modules by keywords, numbers, or categories
@@ -486,90 +848,171 @@ When users ask for "details" about something, search for it and provide comprehe
 
 Be conversational, helpful, and focus on pharmacy-related topics. Use the database information to provide accurate, contextual responses."""
 
-            # Prepare conversation history for ChatGPT
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add conversation history to maintain context
-            if conversation_history:
-                for msg in conversation_history[-10:]:  # Last 10 messages
-                    if msg.get("role") == "user":
-                        messages.append({"role": "user", "content": msg["content"]})
-                    elif msg.get("role") == "assistant":
-                        messages.append({"role": "assistant", "content": msg["content"]})
-            
-            # Add current user message
-            messages.append({"role": "user", "content": message})
-            
-            # Check if this is a query that needs database search
-            needs_search = self._should_search_database(message)
-            
-            if needs_search:
-                # Get search results first
-                search_results = self._get_search_results(message, conversation_history)
-                
-                # Add search results to context with strict grounding instruction
-                if search_results and "Error" not in search_results:
-                    messages.append({
-                        "role": "system", 
-                        "content": f"IMPORTANT: Use ONLY the information provided below from the database. Do not make up or hallucinate information. Here are the relevant modules from the database:\n\n{search_results}\n\nAnswer the user's question using ONLY this information. If the information doesn't contain what they're asking for, say so clearly. Be conversational and helpful while staying grounded in the provided data."
-                    })
-                else:
-                    # No database results - let ChatGPT handle gracefully
-                    messages.append({
-                        "role": "system", 
-                        "content": "No relevant information was found in the database for this query. Respond helpfully and suggest the user browse the sidebar or try different keywords."
-                    })
-            
-            # Get response from ChatGPT
-            response = self.llm.invoke(messages)
-            
-            # Clean markdown formatting from the response
-            cleaned_response = self._clean_markdown_formatting(response.content)
-            
-            # Add clickable links to module names
-            linked_response = self._add_module_links(cleaned_response)
-            
-            # Update conversation history with new messages
-            updated_history = (conversation_history or []).copy()
-            updated_history.append({"role": "user", "content": message})
-            updated_history.append({"role": "assistant", "content": linked_response})
+        # Prepare conversation history for ChatGPT
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # Add conversation history to maintain context: older messages as a
+        # summary, recent ones verbatim (trimmed from the oldest end to fit the
+        # token budget)
+        if conversation_history:
+            summary, recent = self._summarize_history(conversation_history)
+            if summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
             
-            return {
-                "response": linked_response,
-                "conversation_history": updated_history,
-                "agent_used": True
-            }
+            for msg in _trim_to_token_budget(recent):
+                if msg.get("role") == "user":
+                    messages.append({"role": "user", "content": msg["content"]})
+                elif msg.get("role") == "assistant":
+                    messages.append({"role": "assistant", "content": msg["content"]})
+        
+        # Add current user message
+        messages.append({"role": "user", "content": message})
+        
+        # Check if this is a query that needs database search
+        analysis = self._analyze_query(message)
+        needs_search = self._should_search_database(message, analysis)
+        
+        if needs_search:
+            # Get search results first
+            search_results = self._get_search_results(message, conversation_history, analysis)
             
-        except Exception as e:
-            return {
-                "response": f"I encountered an error: {str(e)}. Please try rephrasing your question.",
-                "conversation_history": conversation_history or [],
-                "agent_used": False
-            }
+            # Add search results to context with strict grounding instruction
+            if search_results and "Error" not in search_results:
+                messages.append({
+                    "role": "system", 
+                    "content": f"IMPORTANT: Use ONLY the information provided below from the database. Do not make up or hallucinate information. Here are the relevant modules from the database:\n\n{search_results}\n\nAnswer the user's question using ONLY this information. If the information doesn't contain what they're asking for, say so clearly. Be conversational and helpful while staying grounded in the provided data."
+                })
+            else:
+                # No database results - let ChatGPT handle gracefully
+                messages.append({
+                    "role": "system", 
+                    "content": "No relevant information was found in the database for this query. Respond helpfully and suggest the user browse the sidebar or try different keywords."
+                })
+        
+        return messages
     
-    def _should_search_database(self, message: str) -> bool:
-        """Determine if the message needs database search"""
-        message_lower = message.lower()
+    def _canned_response(self, message: str, conversation_history: List[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """Chat result for a bare greeting or help request, or None if the model is needed"""
+        normalized = message.lower().strip(" \t\n!?.,")
+        if normalized in _CANNED_GREETINGS:
+            reply = _GREETING_REPLY
+        elif normalized in _CANNED_HELP:
+            reply = _HELP_REPLY
+        else:
+            return None
         
-        # Don't search for simple greetings
-        greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening", "how are you"]
-        if any(greeting in message_lower for greeting in greetings):
-            return False
+        updated_history = (conversation_history or []).copy()
+        updated_history.append({"role": "user", "content": message})
+        updated_history.append({"role": "assistant", "content": reply})
         
-        # Don't search for general help requests
-        help_phrases = ["help", "what can you do", "what do you do", "how do you work"]
-        if any(phrase in message_lower for phrase in help_phrases):
+        return {
+            "response": reply,
+            "conversation_history": updated_history,
+            "agent_used": True
+        }
+    
+    def _summarize_history(self, history: List[Dict[str, str]]) -> tuple:
+        """Split history into (summary of older exchanges, recent messages sent verbatim)
+        
+        Each older exchange is summarized on its own and cached on its own
+        messages, so a cached summary only ever depends on the messages in its
+        key: the agent is shared by every client, and two conversations that
+        happen to contain the same exchange (say a canned greeting) must not
+        see each other's earlier turns. Exchanges don't move as the history
+        window slides (enhanced_chat_api echoes at most MAX_HISTORY_MESSAGES),
+        so each turn usually summarizes just the exchange that stopped being
+        recent. Exchanges that can't be summarized are left out; the recent
+        messages are always sent.
+        """
+        exchanges = _exchanges(history)
+        
+        # Keep whole exchanges verbatim, at least _VERBATIM_MESSAGES messages
+        split, verbatim = len(exchanges), 0
+        while split > 0 and verbatim < _VERBATIM_MESSAGES:
+            split -= 1
+            verbatim += len(exchanges[split])
+        older = exchanges[:split]
+        recent = [msg for exchange in exchanges[split:] for msg in exchange]
+        if not older:
+            return "", recent
+        
+        keys = [_history_key(exchange) for exchange in older]
+        summaries = [self._summary_cache.get(key) for key in keys]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        if missing:
+            prompts = [
+                [
+                    {"role": "system", "content": _SUMMARY_PROMPT},
+                    {"role": "user", "content": "\n".join(
+                        f"{'User' if m.get('role') == 'user' else 'Assistant'}: {m.get('content', '')}"
+                        for m in _trim_to_token_budget(older[i], budget=1500)
+                    )}
+                ]
+                for i in missing
+            ]
+            try:
+                # One request per exchange, run concurrently
+                replies = self.summary_llm.batch(prompts)
+            except Exception as e:
+                logger.warning(f"Could not summarize conversation history: {e}")
+            else:
+                for i, reply in zip(missing, replies):
+                    summaries[i] = reply.content.strip()
+                    self._summary_cache.set(keys[i], summaries[i])
+        
+        return " ".join(summary for summary in summaries if summary), recent
+    
+    def _finish_response(self, content: str, message: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Clean and link a model reply and append the exchange to the conversation history"""
+        # Clean markdown formatting from the response (uncached: replies are one-off)
+        cleaned_response = _clean_markdown_formatting.__wrapped__(content)
+        
+        # Add clickable links to module names
+        linked_response = self._add_module_links(cleaned_response)
+        
+        # Update conversation history with new messages
+        updated_history = (conversation_history or []).copy()
+        updated_history.append({"role": "user", "content": message})
+        updated_history.append({"role": "assistant", "content": linked_response})
+        
+        return {
+            "response": linked_response,
+            "conversation_history": updated_history,
+            "agent_used": True
+        }
+    
+    def _error_response(self, error: Exception, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Chat result reporting an error; agent_used=False tells callers not to cache it"""
+        return {
+            "response": f"I encountered an error: {str(error)}. Please try rephrasing your question.",
+            "conversation_history": conversation_history or [],
+            "agent_used": False
+        }
+    
+    def _should_search_database(self, message: str, analysis: Optional[Dict[str, Any]] = None) -> bool:
+        """Determine if the message needs database search"""
+        analysis = analysis or self._analyze_query(message)
+        
+        # Don't search for simple greetings or general help requests
+        if analysis["is_greeting"] or analysis["is_help_request"]:
             return False
         
         # Search for anything else - including questions about modules, categories, etc.
         return True
     
-    def _get_search_results(self, message: str, conversation_history: List[Dict[str, str]] = None) -> str:
+    def _get_search_results(self, message: str, conversation_history: List[Dict[str, str]] = None,
+                            analysis: Optional[Dict[str, Any]] = None) -> str:
         """Get search results from database"""
         try:
+            analysis = analysis or self._analyze_query(message)
+            
             # Check for specific module numbers first
-            import re
-            module_numbers = re.findall(r'(\d+\.\d+)', message)
+            module_numbers = analysis["module_numbers"]
+            
+            if len(module_numbers) > 1:
+                # e.g. "compare 13.20 and 2.30": look them all up at once (up to 4)
+                distinct = list(dict.fromkeys(module_numbers))[:4]
+                return "\n---\n".join(_details_executor.map(self._get_module_details, distinct))
             
             if module_numbers:
                 # Get detailed info for specific module
@@ -578,37 +1021,21 @@ Be conversational, helpful, and focus on pharmacy-related topics. Use the databa
             
             # Check for context-aware queries
             if conversation_history:
-                # Look for recently mentioned module numbers in conversation
-                recent_modules = []
-                for msg in conversation_history[-6:]:  # Last 6 messages
-                    if msg.get("role") == "assistant":
-                        content = msg.get("content", "")
-                        # Extract module numbers from assistant responses
-                        module_nums = re.findall(r'(\d+\.\d+)', content)
-                        recent_modules.extend(module_nums)
-                
                 # If user is asking about "this module" or similar, use the most recent module
                 # Also detect questions about specific aspects like "key metrics", "what about", etc.
-                context_phrases = [
-                    "this module", "it", "that module", "what does this do", "tell me more about it", 
-                    "more details", "details", "key metrics", "what about", "tell me about", 
-                    "explain", "what are the", "what is the", "how about", "show me", "describe"
-                ]
-                
-                # Check if the query is asking about the module in context (without mentioning a specific module number)
-                is_context_query = any(phrase in message.lower() for phrase in context_phrases)
-                has_no_specific_module = not re.findall(r'(\d+\.\d+)', message)
-                
-                if is_context_query and has_no_specific_module and recent_modules:
-                    module_num = recent_modules[-1]  # Most recent module
-                    return self._get_module_details(module_num)
+                # (module_numbers is empty here, so no specific module was mentioned)
+                if analysis["is_context_query"]:
+                    # Look for recently mentioned module numbers in conversation
+                    recent_modules = _recent_module_refs(conversation_history)
+                    if recent_modules:
+                        module_num = recent_modules[-1]["number"]  # Most recent module
+                        return self._get_module_details(module_num)
             
             # Check for NMS specifically
-            if "nms" in message.lower():
+            if analysis["mentions_nms"]:
                 return self._search_modules("nms")
             
             # Check for category searches
-            analysis = self._analyze_query(message)
             if analysis["category"]:
                 return self._search_by_category(analysis["category"])
             
@@ -629,19 +1056,7 @@ Be conversational, helpful, and focus on pharmacy-related topics. Use the databa
             }
         
         # Look for recent module mentions
-        recent_modules = []
-        for msg in conversation_history[-6:]:  # Last 6 messages
-            if msg.get("role") == "assistant":
-                content = msg.get("content", "")
-                # Extract module numbers from assistant responses
-                import re
-                module_numbers = re.findall(r'(\d+\.\d+)', content)
-                for module_num in module_numbers:
-                    if module_num not in [m["number"] for m in recent_modules]:
-                        # Try to extract the full title
-                        title_match = re.search(rf'{re.escape(module_num)}[^\n]*?(?=\n|$|\(|\*|$)', content)
-                        title = title_match.group(0).strip() if title_match else f"{module_num}"
-                        recent_modules.append({"number": module_num, "title": title})
+        recent_modules = _recent_module_refs(conversation_history)
         
         if len(recent_modules) == 1:
             return {
@@ -650,7 +1065,8 @@ Be conversational, helpful, and focus on pharmacy-related topics. Use the databa
                 "agent_used": True
             }
         elif len(recent_modules) > 1:
-            module_list = " or ".join([f"**{m['number']}**" for m in recent_modules[:2]])
+            # The two most recently mentioned, newest first
+            module_list = " or ".join([f"**{m['number']}**" for m in reversed(recent_modules[-2:])])
             return {
                 "response": f"Are you looking for details about {module_list} as discussed previously? Or something else?",
                 "conversation_history": conversation_history or [],
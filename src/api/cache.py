@@ -0,0 +1,67 @@
+"""
+In-process caches shared by the API and the agent
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any
+
+
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after ttl seconds
+    
+    Pass threadsafe=True for caches used from worker threads (the agent's
+    tools run under asyncio.to_thread); caches only touched from the event
+    loop skip the lock.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float, threadsafe: bool = False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock() if threadsafe else nullcontext()
+    
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl: float = None):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def invalidate(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Search engine results, per worker. Entries age out after five minutes rather
+# than being invalidated, since embeddings are rebuilt by a separate script.
+# Empty results (no match, or SemanticSearch swallowing an error) are kept for
+# EMPTY_RESULT_TTL seconds only, so a degraded search doesn't stick
+search_cache = TTLCache(maxsize=1024, ttl=300)
+EMPTY_RESULT_TTL = 15
+
+
+def search_cache_key(kind: str, query: str, *args: Any) -> tuple:
+    """Cache key for a search call: its kind, the normalized query and its other arguments"""
+    return (kind, query.lower().strip(), *args)
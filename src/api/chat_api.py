@@ -3,12 +3,16 @@ Chat API endpoints for RWA Chatbot Phase 1
 Provides conversational interface for Tableau object discovery
 """
 
+import os
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel, Field
 from datetime import datetime
+from redis.asyncio import Redis
 from src.search.semantic_search import SemanticSearch
+from src.api.cache import EMPTY_RESULT_TTL, search_cache, search_cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -54,8 +58,65 @@ class ConversationHistory(BaseModel):
     updated_at: str
 
 
-# In-memory conversation storage (in production, use Redis or database)
-conversations: Dict[str, List[ChatMessage]] = {}
+# Conversations expire a day after their last message and keep the newest 100 messages
+CONVERSATION_TTL_SECONDS = 86400
+MAX_CONVERSATION_MESSAGES = 100
+
+
+class ConversationStore:
+    """Conversation history in Redis, shared by every worker
+    
+    Each conversation is a Redis list at conv:{id}:msgs of JSON-encoded
+    ChatMessages, trimmed to MAX_CONVERSATION_MESSAGES and expiring
+    CONVERSATION_TTL_SECONDS after the last write.
+    """
+    
+    def __init__(self, redis: Redis):
+        self.redis = redis
+    
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}:msgs"
+    
+    async def get_history(self, conversation_id: str) -> List[ChatMessage]:
+        """Get conversation history"""
+        raw_messages = await self.redis.lrange(self._key(conversation_id), 0, -1)
+        return [ChatMessage.model_validate_json(raw) for raw in raw_messages]
+    
+    async def add_message(self, conversation_id: str, message: ChatMessage):
+        """Add message to conversation history"""
+        key = self._key(conversation_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, message.model_dump_json())
+            pipe.ltrim(key, -MAX_CONVERSATION_MESSAGES, -1)
+            pipe.expire(key, CONVERSATION_TTL_SECONDS)
+            await pipe.execute()
+    
+    async def delete(self, conversation_id: str) -> bool:
+        """Delete a conversation; False if it didn't exist"""
+        return bool(await self.redis.delete(self._key(conversation_id)))
+    
+    async def list_ids(self) -> List[str]:
+        """IDs of all stored conversations"""
+        return [
+            key[len("conv:"):-len(":msgs")]
+            async for key in self.redis.scan_iter(match="conv:*:msgs", count=500)
+        ]
+
+
+# Initialize conversation store lazily
+conversation_store = None
+
+def get_conversation_store() -> ConversationStore:
+    """Get conversation store instance (lazy initialization)"""
+    global conversation_store
+    if conversation_store is None:
+        conversation_store = ConversationStore(Redis.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            max_connections=50,
+            decode_responses=True
+        ))
+    return conversation_store
 
 
 def generate_conversation_id() -> str:
@@ -64,16 +125,14 @@ def generate_conversation_id() -> str:
     return str(uuid.uuid4())
 
 
-def get_conversation_history(conversation_id: str) -> List[ChatMessage]:
-    """Get conversation history"""
-    return conversations.get(conversation_id, [])
-
-
-def add_message_to_conversation(conversation_id: str, message: ChatMessage):
-    """Add message to conversation history"""
-    if conversation_id not in conversations:
-        conversations[conversation_id] = []
-    conversations[conversation_id].append(message)
+async def get_similar_objects_cached(object_id: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """Objects similar to object_id, memoized per object in the shared search cache"""
+    cache_key = ("similar", object_id, limit)
+    similar = search_cache.get(cache_key)
+    if similar is None:
+        similar = await asyncio.to_thread(get_search_engine().get_similar_objects, object_id, limit=limit)
+        search_cache.set(cache_key, similar, ttl=None if similar else EMPTY_RESULT_TTL)
+    return similar
 
 
 def format_search_results(results: List[Dict[str, Any]]) -> str:
@@ -167,7 +226,7 @@ def generate_chat_response(user_message: str, results: List[Dict[str, Any]],
 
 
 @router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, store: ConversationStore = Depends(get_conversation_store)):
     """
     Chat with the Tableau assistant
     
@@ -181,29 +240,41 @@ async def chat(request: ChatRequest):
         # Generate or use existing conversation ID
         conversation_id = request.conversation_id or generate_conversation_id()
         
-        # Get conversation history
-        history = get_conversation_history(conversation_id)
-        
         # Add user message to history
         user_message = ChatMessage(
             role="user",
             content=request.message,
             timestamp=datetime.now().isoformat()
         )
-        add_message_to_conversation(conversation_id, user_message)
+        await store.add_message(conversation_id, user_message)
         
-        # Perform search
-        search_results = get_search_engine().search(request.message, limit=10)
+        # Perform search (embedding + database work, so off the event loop);
+        # repeated questions are served from the shared search cache
+        cache_key = search_cache_key("chat", request.message, 10)
+        search_results = search_cache.get(cache_key)
+        if search_results is None:
+            search_results = await asyncio.to_thread(get_search_engine().search, request.message, limit=10)
+            search_cache.set(cache_key, search_results, ttl=None if search_results else EMPTY_RESULT_TTL)
         
-        # Get similar objects if requested
+        # Get similar objects if requested, for the top results concurrently
         similar_objects = []
         if request.include_similar and search_results:
-            # Find similar objects for the first result
-            first_result = search_results[0]
-            similar_objects = get_search_engine().get_similar_objects(
-                first_result.get("object_id", ""), 
-                limit=3
-            )
+            top_results = search_results[:3]
+            similars = await asyncio.gather(*[
+                get_similar_objects_cached(r.get("object_id", ""), limit=3)
+                for r in top_results
+            ])
+            
+            # Merge, dropping duplicates and objects that are already top
+            # results, and keep the 3 most similar
+            seen = {r.get("object_id") for r in top_results}
+            for objects in similars:
+                for obj in objects:
+                    if obj.get("object_id") not in seen:
+                        seen.add(obj.get("object_id"))
+                        similar_objects.append(obj)
+            similar_objects.sort(key=lambda obj: obj.get("similarity_score", 0.0), reverse=True)
+            del similar_objects[3:]
         
         # Generate response
         response_text = generate_chat_response(
@@ -218,7 +289,7 @@ async def chat(request: ChatRequest):
             content=response_text,
             timestamp=datetime.now().isoformat()
         )
-        add_message_to_conversation(conversation_id, assistant_message)
+        await store.add_message(conversation_id, assistant_message)
         
         # Prepare response
         return ChatResponse(
@@ -239,7 +310,7 @@ async def chat(request: ChatRequest):
 
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationHistory)
-async def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str, store: ConversationStore = Depends(get_conversation_store)):
     """
     Get conversation history
     
@@ -250,7 +321,7 @@ async def get_conversation(conversation_id: str):
         Conversation history
     """
     try:
-        messages = get_conversation_history(conversation_id)
+        messages = await store.get_history(conversation_id)
         
         if not messages:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -270,7 +341,7 @@ async def get_conversation(conversation_id: str):
 
 
 @router.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: str):
+async def delete_conversation(conversation_id: str, store: ConversationStore = Depends(get_conversation_store)):
     """
     Delete conversation history
     
@@ -281,8 +352,7 @@ async def delete_conversation(conversation_id: str):
         Success message
     """
     try:
-        if conversation_id in conversations:
-            del conversations[conversation_id]
+        if await store.delete(conversation_id):
             return {"message": "Conversation deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -295,7 +365,7 @@ async def delete_conversation(conversation_id: str):
 
 
 @router.get("/conversations")
-async def list_conversations():
+async def list_conversations(store: ConversationStore = Depends(get_conversation_store)):
     """
     List all conversations
     
@@ -303,9 +373,10 @@ async def list_conversations():
         List of conversation IDs
     """
     try:
+        conversation_ids = await store.list_ids()
         return {
-            "conversations": list(conversations.keys()),
-            "total_count": len(conversations)
+            "conversations": conversation_ids,
+            "total_count": len(conversation_ids)
         }
         
     except Exception as e:
@@ -314,7 +385,7 @@ async def list_conversations():
 
 
 @router.get("/health")
-async def chat_health():
+async def chat_health(store: ConversationStore = Depends(get_conversation_store)):
     """
     Health check for chat functionality
     
@@ -323,13 +394,16 @@ async def chat_health():
     """
     try:
         # Test search functionality
-        test_results = get_search_engine().search("test", limit=1)
+        test_results = await asyncio.to_thread(get_search_engine().search, "test", limit=1)
+        
+        # Test conversation storage
+        await store.redis.ping()
         
         return {
             "status": "healthy",
             "chat_service": "operational",
             "get_search_engine()": "connected",
-            "conversations_active": len(conversations)
+            "conversation_store": "connected"
         }
         
     except Exception as e:
@@ -3,11 +3,13 @@ Search API endpoints for RWA Chatbot Phase 1
 Provides REST API for searching Tableau objects
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
 from pydantic import BaseModel, Field
 from src.search.semantic_search import SemanticSearch
+from src.api.cache import EMPTY_RESULT_TTL, search_cache, search_cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -74,10 +76,13 @@ class SearchStatsResponse(BaseModel):
 
 
 @router.post("/", response_model=SearchResponse)
-async def search_objects(request: SearchRequest):
+async def search_objects(request: SearchRequest, response: Response):
     """
     Search for Tableau objects using semantic search
     
+    Repeated searches (same normalized query, filters and limit) are served
+    from a short-lived cache; the X-Cache header reports HIT or MISS.
+    
     Args:
         request: Search request with query and filters
         
@@ -88,25 +93,41 @@ async def search_objects(request: SearchRequest):
         import time
         start_time = time.time()
         
-        # Perform search
-        if request.object_type:
-            results = get_search_engine().search_by_type(
-                request.query, 
-                request.object_type, 
-                request.limit
-            )
-        elif request.project_name:
-            results = get_search_engine().search_by_project(
-                request.query, 
-                request.project_name, 
-                request.limit
-            )
-        else:
-            results = get_search_engine().search(
-                request.query, 
-                request.limit, 
-                request.similarity_threshold
-            )
+        cache_key = search_cache_key(
+            "search_objects",
+            request.query,
+            request.object_type,
+            request.project_name,
+            request.limit,
+            request.similarity_threshold
+        )
+        results = search_cache.get(cache_key)
+        response.headers["X-Cache"] = "MISS" if results is None else "HIT"
+        
+        # Perform search (embedding + database work, so off the event loop)
+        if results is None:
+            if request.object_type:
+                results = await asyncio.to_thread(
+                    get_search_engine().search_by_type,
+                    request.query, 
+                    request.object_type, 
+                    request.limit
+                )
+            elif request.project_name:
+                results = await asyncio.to_thread(
+                    get_search_engine().search_by_project,
+                    request.query, 
+                    request.project_name, 
+                    request.limit
+                )
+            else:
+                results = await asyncio.to_thread(
+                    get_search_engine().search,
+                    request.query, 
+                    request.limit, 
+                    request.similarity_threshold
+                )
+            search_cache.set(cache_key, results, ttl=None if results else EMPTY_RESULT_TTL)
         
         search_time = (time.time() - start_time) * 1000  # Convert to milliseconds
         
@@ -162,7 +183,7 @@ async def get_search_suggestions(
         List of search suggestions
     """
     try:
-        suggestions = get_search_engine().get_search_suggestions(q, limit)
+        suggestions = await asyncio.to_thread(get_search_engine().get_search_suggestions, q, limit)
         
         return SearchSuggestionsResponse(
             suggestions=suggestions,
@@ -190,7 +211,7 @@ async def get_similar_objects(
         List of similar objects
     """
     try:
-        results = get_search_engine().get_similar_objects(object_id, limit)
+        results = await asyncio.to_thread(get_search_engine().get_similar_objects, object_id, limit)
         
         similar_objects = []
         for result in results:
@@ -227,7 +248,7 @@ async def get_search_stats():
         Search engine statistics
     """
     try:
-        stats = get_search_engine().get_search_stats()
+        stats = await asyncio.to_thread(get_search_engine().get_search_stats)
         
         return SearchStatsResponse(
             total_objects=stats.get("total_objects", 0),
@@ -253,7 +274,7 @@ async def search_health():
     """
     try:
         # Test search functionality
-        test_results = get_search_engine().search("test", limit=1)
+        test_results = await asyncio.to_thread(get_search_engine().search, "test", limit=1)
         
         return {
             "status": "healthy",
@@ -24,6 +24,7 @@ class HybridTableauBot:
         self.search_engine = SemanticSearch()
         self.llm = None
         self.agent = None
+        self.agent_executor = None
         self.tools = None
         
     def initialize(self):
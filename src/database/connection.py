@@ -4,6 +4,7 @@ Handles PostgreSQL connection with pgvector support
 """
 
 import os
+from contextlib import nullcontext
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -90,16 +91,28 @@ def get_db():
         db.close()
 
 
-def test_connection() -> bool:
+def open_connection():
+    """Open a connection from the engine; use as a context manager so it is returned"""
+    return get_engine().connect()
+
+
+def _connection_scope(conn=None):
+    """Context manager yielding conn if given, otherwise a fresh connection closed on exit"""
+    return nullcontext(conn) if conn is not None else open_connection()
+
+
+def test_connection(conn=None) -> bool:
     """
     Test database connection and verify pgvector extension
     
+    Args:
+        conn: Optional open connection to reuse instead of checking one out
+    
     Returns:
         bool: True if connection successful and pgvector available
     """
     try:
-        db_engine = get_engine()
-        with db_engine.connect() as conn:
+        with _connection_scope(conn) as conn:
             # Test basic connection
             result = conn.execute(text("SELECT 1"))
             logger.info("Database connection successful")
@@ -130,14 +143,19 @@ def create_tables():
         return False
 
 
-def run_setup_script():
+def run_setup_script(conn=None):
     """
     Run the database setup script to create schema and tables
     This should be run once to set up the database
+    
+    The pgvector extension is verified on the same connection afterwards,
+    so no separate test_connection() round trip is needed.
+    
+    Args:
+        conn: Optional open connection to reuse instead of checking one out
     """
     try:
-        db_engine = get_engine()
-        with db_engine.connect() as conn:
+        with _connection_scope(conn) as conn:
             # Read and execute the setup script
             with open('setup_database.sql', 'r') as f:
                 setup_sql = f.read()
@@ -146,6 +164,12 @@ def run_setup_script():
             conn.execute(text(setup_sql))
             conn.commit()
             
+            # Verify the extension the script creates
+            result = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'vector'"))
+            if not result.fetchone():
+                logger.error("pgvector extension missing after running setup script")
+                return False
+            
         logger.info("Database setup script executed successfully")
         return True
         
@@ -4,6 +4,7 @@ Provides vector-based semantic search capabilities
 """
 
 import logging
+import threading
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
@@ -23,13 +24,18 @@ class SemanticSearch:
     def __init__(self):
         self.model = None
         self.engine = get_engine()
+        # The API calls search methods from worker threads (asyncio.to_thread);
+        # without this, concurrent first requests would each load a model
+        self._model_lock = threading.Lock()
     
     def _load_model(self):
         """Load the sentence transformer model"""
         if self.model is None:
-            logger.info(f"Loading embedding model: {MODEL_NAME}")
-            self.model = SentenceTransformer(MODEL_NAME)
-            logger.info("Model loaded successfully")
+            with self._model_lock:
+                if self.model is None:
+                    logger.info(f"Loading embedding model: {MODEL_NAME}")
+                    self.model = SentenceTransformer(MODEL_NAME)
+                    logger.info("Model loaded successfully")
         return self.model
     
     def search(self, query: str, limit: int = 10, similarity_threshold: float = 0.3) -> List[Dict[str, Any]]:
@@ -45,5 +45,139 @@ def test_agent():
         import traceback
         traceback.print_exc()
 
+class FakeSummaryLLM:
+    """Stands in for the summarizing model, recording each exchange it summarizes"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def batch(self, prompts):
+        from types import SimpleNamespace
+        replies = []
+        for messages in prompts:
+            transcript = messages[-1]["content"]
+            self.calls.append(transcript)
+            # "User: question 3\nAssistant: ..." -> "asked question 3"
+            replies.append(SimpleNamespace(content="asked " + transcript.splitlines()[0][len("User: "):]))
+        return replies
+
+def _summary_test_agent():
+    """RWAAgent with a fake summarizer; skips __init__, so no OpenAI client or database"""
+    from src.api.cache import TTLCache
+    agent = RWAAgent.__new__(RWAAgent)
+    agent._summary_cache = TTLCache(maxsize=4096, ttl=3600, threadsafe=True)
+    agent.summary_llm = FakeSummaryLLM()
+    return agent
+
+def test_summary_cache():
+    """Check a long session only summarizes each exchange once"""
+    from enhanced_chat_api import _bounded_history
+    
+    print("\n🧮 Testing conversation summary cache...")
+    agent = _summary_test_agent()
+    
+    history = []
+    turns = 16
+    for turn in range(turns):
+        agent._summarize_history(history)
+        history = _bounded_history(
+            history,
+            {"role": "user", "content": f"question {turn}"},
+            {"role": "assistant", "content": f"answer {turn}"}
+        )
+    
+    # The last two exchanges are always sent verbatim, so exchanges 0 to
+    # turns - 4 become old enough to summarize; each is summarized once, even
+    # after _bounded_history starts dropping the oldest messages
+    calls = agent.summary_llm.calls
+    print(f"Summarized exchanges over {turns} turns: {len(calls)}")
+    assert len(calls) == len(set(calls)) == turns - 3
+    print("✅ Summary cache reused across turns")
+
+def test_summary_cache_isolation():
+    """Check conversations sharing an exchange don't see each other's earlier turns"""
+    from src.agent.rwa_agent import _GREETING_REPLY, _HELP_REPLY
+    
+    print("\n🔒 Testing conversation summary isolation...")
+    agent = _summary_test_agent()
+    
+    shared = [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": _GREETING_REPLY},
+        {"role": "user", "content": "help"},
+        {"role": "assistant", "content": _HELP_REPLY},
+    ]
+    recent = [
+        {"role": "user", "content": "details on 13.20"},
+        {"role": "assistant", "content": "13.20 NMS Review tracks NMS claims."},
+        {"role": "user", "content": "and 2.30?"},
+        {"role": "assistant", "content": "2.30 covers dispensing volumes."},
+    ]
+    
+    def conversation(opening):
+        return [{"role": "user", "content": opening}, {"role": "assistant", "content": "Noted."}] + shared + recent
+    
+    summary_a, _ = agent._summarize_history(conversation("first user's private question"))
+    summary_b, recent_b = agent._summarize_history(conversation("second user's question"))
+    
+    print(f"Second conversation's summary: {summary_b}")
+    assert "first user" not in summary_b
+    assert "second user" in summary_b and "first user" in summary_a
+    assert recent_b == recent
+    print("✅ Summaries kept to their own conversation")
+
+# Module titles from the catalog (see "RWA ChatBot Docs")
+CATALOG_TITLES = [
+    "13.20 NMS Review", "4.60 Electronic Repeat Dispensing", "Benchmarking", "Branch Productivity",
+    "Care Homes", "Claim Prep", "Dead Stock", "Exemptions & Dispensing Exceptions", "Financials",
+    "Nominations", "Overdue Patients", "PQS_Clinical_Health_Patient_Services", "Patient Operations",
+    "Patient_Services", "Payment Reconciliation", "Performance Management _1.05 Executive Monthly Dashboard",
+    "Performance Management _1.45 Branch_Monthly_Reports", "Performance Management _1.80 Branch_Weekly_Reports",
+    "Performance Management _1.85 Company_Weekly_Report",
+    "Performance Management _1.85 Weekly_Company_by_Branch_Report",
+    "Performance Management _13.05_Weekly_Services_Report", "Profiling", "Script Compliance",
+    "Supply Chain", "Surgery Analysis", "Healthcare Margins", "Customer Productivity",
+]
+
+def test_title_classification_parity():
+    """Check the category index picks what the original elif chains of substring checks did"""
+    from enhanced_chat_api import _DETAILED_CATEGORY_INDEX, _SUMMARY_CATEGORY_INDEX, _classify_title
+    
+    print("\n🏷️ Testing module title classification...")
+    
+    def summary_chain(title_lower):
+        if any(word in title_lower for word in ["financial", "sales", "margin"]):
+            return "financial performance"
+        elif any(word in title_lower for word in ["patient", "customer"]):
+            return "patient management"
+        elif any(word in title_lower for word in ["product", "dispensing"]):
+            return "product operations"
+        elif any(word in title_lower for word in ["clinical", "mur", "nms"]):
+            return "clinical services"
+        return None
+    
+    def detailed_chain(title_lower):
+        if any(word in title_lower for word in ["financial", "sales", "margin", "revenue", "cost"]):
+            return "financial performance and reporting"
+        elif any(word in title_lower for word in ["patient", "care", "service", "clinical", "nms", "mur"]):
+            return "patient care and clinical services"
+        elif any(word in title_lower for word in ["stock", "inventory", "product", "dispensing"]):
+            return "inventory and product management"
+        elif any(word in title_lower for word in ["staff", "productivity", "performance", "management"]):
+            return "staff performance and management"
+        elif any(word in title_lower for word in ["compliance", "regulatory", "audit", "quality"]):
+            return "compliance and quality assurance"
+        return None
+    
+    for title in CATALOG_TITLES:
+        match = _classify_title(title, _SUMMARY_CATEGORY_INDEX)
+        assert (match[1] if match else None) == summary_chain(title.lower()), title
+        match = _classify_title(title, _DETAILED_CATEGORY_INDEX)
+        assert (match[1] if match else None) == detailed_chain(title.lower()), title
+    print(f"✅ {len(CATALOG_TITLES)} titles classified as before")
+
 if __name__ == "__main__":
     test_agent()
+    test_summary_cache()
+    test_summary_cache_isolation()
+    test_title_classification_parity()